@@ -1,6 +1,6 @@
 import argparse
 from functools import partial
-from typing import Any
+from typing import Any, List, Optional
 
 
 def add_boolean(self, arg_name: str, dest: str, default: Any, **extra):
@@ -18,16 +18,33 @@ parser.add_boolean = partial(add_boolean, parser)
 parser.add_argument("contract", help="The smart contract solidity file to process")
 
 parser.add_argument('--debug', dest="debug", action='store_true', help='Debug Mode', default=False)
+parser.add_argument('--log-level', dest='log_level', default=None, choices=['debug', 'info', 'warning', 'error'],
+                    help="The minimum level of the logged messages. Defaults to debug in debug mode, otherwise info.")
+parser.add_argument('--profile', dest='profile', default='none', choices=['none', 'summary', 'cprofile', 'pyinstrument'],
+                    help="Print a table of the phase times at the end of the run, and with cprofile or pyinstrument "
+                         "also store the profile of the run in the workspace.")
+parser.add_boolean('--log-jsonl', dest='log_jsonl', default=False,
+                   help="Also write the log as JSON lines to `out.jsonl` in the workspace.")
 parser.add_boolean('--clean', dest='clean_workspace', default=False,
                    help="Cleans the output/ directory before adding new workspace directories.")
 
+# Compilation Cache
+parser.add_boolean('--cache', dest='use_cache', default=True,
+                   help="Reuse the compilation artifacts and the CFG of unchanged contracts from the cache directory.")
+parser.add_argument('--cache-dir', dest='cache_dir', default='.cache/',
+                    help="The directory of the compilation cache.")
+
 # Targeted Backward Symbolic Execution
-parser.add_argument('--target', dest='target', type=int, required=False,
-                    help="The line-number which the target of Targeted Backward Symbolic Execution")
+parser.add_argument('--target', dest='target', type=int, required=False, nargs='+', action='extend',
+                    help="The line-numbers of the targets of Targeted Backward Symbolic Execution. Test data is found "
+                         "for each target in one traversal.")
 
 # CFG Options
 parser.add_argument('--cfg-strategy', dest='cfg_strategy', default='compound',
                     help="The CFG drawing strategy. Choose compound for compounding all functions.")
+parser.add_argument('--cfg-file', dest='cfg_file', default=None,
+                    help="Load the CFG from a file exported by --export-compact-cfg instead of running Slither. The file "
+                         "must be exported from the same source with the same targets.")
 parser.add_argument('--cfg-expr-type', dest='cfg_expr_type', default='sol', choices=['sol', 'irs', 'irs_ssa'],
                     help="The expressions' type for CFG. Available options are 'sol' for solidity expressions, "
                          "'irs' for IR expressions, and 'irs_ssa' for SSA IRs.")
@@ -36,31 +53,112 @@ parser.add_argument('--cfg-expr-type', dest='cfg_expr_type', default='sol', choi
 parser.add_argument('--heuristic', dest='heuristic',
                     help="The heuristic to traverse CFG and find test data.")
 
+# Solver
+parser.add_boolean('--incremental-solving', dest='incremental_solving', default=False,
+                   help="Share one solver between the paths of the walk tree and only assert the constraints of the "
+                        "newly added node on each expansion.")
+parser.add_boolean('--unsat-core-pruning', dest='unsat_core_pruning', default=False,
+                   help="Keep the unsat cores of the infeasible paths, and prune the paths which contain the "
+                        "constraints of a core without a solver call.")
+parser.add_boolean('--slice-constraints', dest='slice_constraints', default=False,
+                   help="Check only the cone of influence of the path conditions (CONDITION, require, and assert): "
+                        "the trivial constraints and the definitions of the variables which the conditions do not "
+                        "depend on are dropped, and the rest are simplified. The inputs out of the cone are `any`.")
+parser.add_argument('--mapping-encoding', dest='mapping_encoding', default='function', choices=['function', 'array'],
+                    help="The encoding of the mappings: uninterpreted functions with a `ForAll` for each write "
+                         "(function), or an array for each SSA version with `Store`/`Select` and the balances as a "
+                         "constant array, which is quantifier-free (array).")
+parser.add_argument('--arithmetic-abstraction', dest='arithmetic_abstraction', default='none',
+                    choices=['none', 'narrow', 'int'],
+                    help="The abstraction of the integers and the addresses in the search: the declared widths with "
+                         "the addresses as 256-bit words (none), the addresses as 160 bits (narrow), or unbounded "
+                         "integers with the range of each assigned variable, which is checked arithmetic without "
+                         "wrap-around (int). The paths to the entry point are checked again at the full width, so "
+                         "there are no false positives, but the `int` abstraction may miss the paths which need a "
+                         "wrap-around.")
+parser.add_argument('--max-transactions', dest='max_transactions', type=int, default=None,
+                    help="The maximum number of the transactions (without the constructor) on a path. Unbounded by "
+                         "default.")
+parser.add_argument('--max-loop-iterations', dest='max_loop_iterations', type=int, default=None,
+                    help="The maximum number of the iterations of each loop in a transaction. Unbounded by default.")
+parser.add_boolean('--cache-infeasible-states', dest='cache_infeasible_states', default=False,
+                   help="Keep the states of the infeasible paths (the unsat core, or all the constraints, with the SSA "
+                        "variables renamed relative to their live versions at the node), and prune the paths which "
+                        "contain one of the states of their node without a solver call, e.g., after one more cycle.")
+parser.add_argument('--visited-states-size', dest='visited_states_size', type=int, default=0,
+                    help="The maximum number of the visited states (the node, the SSA indices, and the constraints) "
+                         "kept to skip the paths which reach a visited state again. The least recently used states "
+                         "are evicted. Use 0 (the default) to disable it.")
+parser.add_argument('--parallel-checks', dest='parallel_checks', type=int, default=1,
+                    help="The number of the best frontiers which are checked speculatively at once by a pool of worker "
+                         "processes. The results are used in the order of the serial search (the default, 1), so the "
+                         "walk tree and the found paths are the same, but the inputs (the model) of a found path are "
+                         "solved again in the main process, and the solver may pick other inputs than in the serial "
+                         "search.")
+parser.add_argument('--solver-tactic', dest='solver_tactic', default='default',
+                    choices=['default', 'bit-blast', 'qfbv'],
+                    help="The solver of the path checks: the default z3 solver, the simplify, solve-eqs, bit-blast, "
+                         "and sat pipeline, which uses the default tactic for the formulas which are not QF_BV "
+                         "(bit-blast), or z3's qfbv tactic. The tactic solvers have no unsat cores, so "
+                         "--unsat-core-pruning does not prune with them.")
+parser.add_argument('--solver-timeout', dest='solver_timeout', type=int, default=None,
+                    help="The timeout of each path check in milliseconds. The checks which time out are unknown, and "
+                         "the path is checked again with twice the timeout after all the other frontiers. No timeout "
+                         "by default.")
+parser.add_argument('--solver-timeout-retries', dest='solver_timeout_retries', type=int, default=3,
+                    help="The number of times a path whose check timed out is checked again, before it is dropped as "
+                         "unknown. The other unknown results (e.g., of the quantifiers) are dropped at once.")
+parser.add_argument('--solver-portfolio', dest='solver_portfolio', nargs='+', default=None,
+                    choices=['default', 'bit-blast', 'qfbv'],
+                    help="Race these solver tactics on each path check in worker processes, and take the first "
+                         "SAT/UNSAT result. The slower checks are not interrupted, so it requires --solver-timeout.")
+parser.add_argument('--ir-cache-size', dest='ir_cache_size', type=int, default=4096,
+                    help="The maximum number of translated IR expressions kept in the translation cache. "
+                         "Use 0 to disable the cache.")
+
 # Exporters
-parser.add_boolean('--export-ast', dest='export_ast', default=True,
+parser.add_argument('--export-profile', dest='export_profile', default='fast', choices=['full', 'fast', 'none'],
+                    help="The exports which are stored when their --export-* option is not given. 'fast' only stores "
+                         "the cheap ones (LoC and the compiler outputs except AST and ASM), 'full' also stores the "
+                         "AST, the ASM, the pyevmasm opcodes and the dot CFGs. The exports are stored in background "
+                         "after the search.")
+parser.add_boolean('--export-ast', dest='export_ast', default=None,
                    help="Store the ast value of the smart contract in output directory as `output.ast`.")
-parser.add_boolean('--export-bin', dest='export_bin', default=True,
+parser.add_boolean('--export-bin', dest='export_bin', default=None,
                    help="Store the bin(evm) value of the smart contract in output directory as `output.bin`.")
-parser.add_boolean('--export-abi', dest='export_abi', default=True,
+parser.add_boolean('--export-abi', dest='export_abi', default=None,
                    help="Store the ABI value of the smart contract in output directory as `output.abi`.")
-parser.add_boolean('--export-opcodes', dest='export_opcodes', default=True,
+parser.add_boolean('--export-opcodes', dest='export_opcodes', default=None,
                    help="Store the OPCodes of the smart contract in output directory as `output.opcodes`.")
-parser.add_boolean('--export-opcodes-pyevmasm', dest='export_opcodes_pyevmasm', default=True,
+parser.add_boolean('--export-opcodes-pyevmasm', dest='export_opcodes_pyevmasm', default=None,
                    help="Store the converted opcodes by pyevmasm of the smart contract in output directory as "
                         "`output.opcodes_pyevmasm`.")
-parser.add_boolean('--export-storage-layout', dest='export_storage_layout', default=True,
+parser.add_boolean('--export-storage-layout', dest='export_storage_layout', default=None,
                    help="Store the storage-layout of the contract in output directory as `output.storage_layout`.")
-parser.add_boolean('--export-metadata', dest='export_metadata', default=True,
+parser.add_boolean('--export-metadata', dest='export_metadata', default=None,
                    help="Store the metadata for the smart contract in output directory as `output.metadata`.")
-parser.add_boolean('--export-loc', dest='export_loc', default=True,
+parser.add_boolean('--export-loc', dest='export_loc', default=None,
                    help="Store the LoC for the smart contract in output directory as `output.loc`.")
-parser.add_boolean('--export-srcmap', dest='export_srcmap', default=True,
+parser.add_boolean('--export-srcmap', dest='export_srcmap', default=None,
                    help="Store the srcmap for the smart contract in output directory as `output.srcmap`.")
-parser.add_boolean('--export-asm', dest='export_asm', default=True,
+parser.add_boolean('--export-asm', dest='export_asm', default=None,
                    help="Store the ASM for the smart contract in output directory as `output.asm`.")
-parser.add_boolean('--export-cfg', dest='export_cfg__dot', default=True,
+parser.add_boolean('--export-cfg', dest='export_cfg__dot', default=None,
                    help="Store the CFG for the smart contract in output directory as `cfg.dot`.")
-parser.add_boolean('--export-reverse-cfg', dest='export_reversed_cfg__dot', default=True,
+parser.add_boolean('--export-compact-cfg', dest='export_compact_cfg__jsonl', default=None,
+                   help="Store the CFG in the compact format of `--cfg-file` in output directory as `compact_cfg.jsonl`.")
+parser.add_boolean('--export-reverse-cfg', dest='export_reversed_cfg__dot', default=None,
                    help="Store the Reversed-CFG for the smart contract in output directory as `reversed_cfg.dot`.")
 
-args = parser.parse_args()
+args = argparse.Namespace()  # Filled by parse_args(), shared by all the modules that imported it
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse `argv` (the command line by default) into `args`. The namespace is updated in place, so each run in the same
+    process (e.g., each job of batch mode) sees its own options through the already imported `args`.
+    """
+    parsed = parser.parse_args(argv)
+    args.__dict__.clear()
+    args.__dict__.update(vars(parsed))
+    return args
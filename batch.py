@@ -0,0 +1,254 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import sys
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from multiprocessing.connection import Connection, wait
+from typing import Iterator, List, Optional, Tuple
+
+import z3
+
+import main
+from sol_utils import SolcSelectHelper
+from workspace import OUTPUT_DIR, current_workspace
+
+JOB_TARGET_REGEX = re.compile(r'^(?P<path>.+\.sol):(?P<targets>\d+(,\d+)*)$')
+RESULT_ANNOTATION_REGEX = re.compile(r'//\s*@result\s+(?P<result>.+)$')
+KILL_GRACE_PERIOD = 5  # Seconds after the timeout of a job before its worker is killed
+
+
+class JobTimeout(BaseException):
+    """Not an `Exception`, so the `except Exception` handlers of the job (e.g., of the caches) do not swallow it"""
+    pass
+
+
+def collect_jobs(paths: List[str]) -> List[Tuple[str, Optional[List[int]]]]:
+    """
+    Expand the given paths to (contract, targets) jobs. Each path is a `.sol` file, a `.sol` file with the target
+    line-numbers as `path.sol:LINE[,LINE...]`, or a directory which is searched recursively for `.sol` files. The
+    targets of the jobs without line-numbers are found by the @target annotations.
+    """
+    jobs = []
+    for path in paths:
+        if matched := JOB_TARGET_REGEX.match(path):
+            jobs.append((matched.group('path'), [int(target) for target in matched.group('targets').split(',')]))
+        elif os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                jobs.extend((os.path.join(root, file), None) for file in files if file.lower().endswith('.sol'))
+        else:
+            jobs.append((path, None))
+    return sorted(jobs, key=lambda job: (job[0], job[1] or []))
+
+
+def expected_result(contract: str) -> Optional[str]:
+    with open(contract) as f:
+        for line in f:
+            if matched := RESULT_ANNOTATION_REGEX.search(line):
+                return matched.group('result').strip()
+
+
+def z3_value_to_json(value):
+    """Convert the z3 values of the model in transactions to JSON values, which can be sent back from the workers"""
+    if z3.is_bv_value(value) or z3.is_int_value(value):
+        return value.as_long()
+    if z3.is_true(value) or z3.is_false(value):
+        return z3.is_true(value)
+    return str(value)
+
+
+def init_worker() -> None:
+    SolcSelectHelper.process_local = True
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def job_record(contract: str, targets: Optional[List[int]]) -> dict:
+    return {'contract': contract, 'targets': targets, 'expected': expected_result(contract)}
+
+
+def run_job(contract: str, targets: Optional[List[int]], extra_args: List[str], timeout: int) -> dict:
+    """
+    Run one job in the (warm) worker process and return its result record. The timeout is enforced by SIGALRM, and
+    the solver calls, which SIGALRM cannot interrupt, also time out after it. The parent kills the worker if the job
+    still runs after the timeout (see `run_jobs`).
+    """
+    argv = [contract, *extra_args, '--no-clean']  # The batch cleans the output directory once, not per job
+    if targets is not None:
+        argv += ['--target', *map(str, targets)]
+
+    record = job_record(contract, targets)
+    start_time = datetime.utcnow().timestamp()
+
+    z3_timeout = z3.get_param('timeout')
+    z3.set_param('timeout', timeout * 1000)  # The default timeout of the solvers, which is the time left of the job
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(timeout)
+    try:
+        results = main.run(argv)
+        reached = [txs is not None for txs in results.values()]
+        record['status'] = 'sat' if reached and all(reached) else 'partial' if any(reached) else 'no_path'
+        record['results'] = json.loads(json.dumps(results, default=z3_value_to_json))  # Target node -> txs
+        record['output'] = main.format_results(results)
+    except JobTimeout:
+        record['status'] = 'timeout'
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+        record['traceback'] = traceback.format_exc()
+    finally:
+        signal.alarm(0)
+        z3.set_param('timeout', z3_timeout)
+
+    record['exec_time'] = datetime.utcnow().timestamp() - start_time
+    record['workspace'] = str(current_workspace()) if current_workspace() is not None else None
+    if record['expected'] is not None and 'output' in record:
+        record['matches_expected'] = record['output'] == record['expected']
+    return record
+
+
+def worker_loop(connection: Connection) -> None:
+    """Run the jobs which are received from the parent one at a time, until `None` is received"""
+    init_worker()
+    while (job := connection.recv()) is not None:
+        connection.send(run_job(*job))
+
+
+class Worker:
+    """A warm worker process with the job which it runs, if any"""
+
+    def __init__(self):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_loop, args=(worker_connection,))
+        self.process.start()
+        worker_connection.close()  # So the parent gets an EOF if the worker dies
+
+        self.job: Optional[Tuple[str, Optional[List[int]]]] = None
+        self.start_time = self.deadline = None
+
+    def submit(self, job: Tuple[str, Optional[List[int]]], extra_args: List[str], timeout: int) -> None:
+        self.job = job
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time + timeout + KILL_GRACE_PERIOD
+        self.connection.send((*job, extra_args, timeout))
+
+    def failed_record(self, status: str, error: Optional[str] = None) -> dict:
+        """The record of the job, which the worker did not send back"""
+        record = job_record(*self.job)
+        record['status'] = status
+        if error is not None:
+            record['error'] = error
+        record['exec_time'] = time.monotonic() - self.start_time
+        record['workspace'] = None
+        return record
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def stop(self) -> None:
+        if self.job is not None or not self.process.is_alive():
+            self.kill()
+            return
+        self.connection.send(None)
+        self.process.join()
+        self.connection.close()
+
+
+def run_jobs(jobs: List[Tuple[str, Optional[List[int]]]], extra_args: List[str], num_workers: int,
+             timeout: int) -> Iterator[dict]:
+    """
+    Run the jobs on a pool of warm worker processes, and yield their records as they finish. A worker which does not
+    send back the record of its job in a grace period after the timeout (e.g., stuck in native code) is killed and
+    replaced, and so is a worker which dies.
+    """
+    pending = deque(jobs)
+    workers = [Worker() for _ in range(min(num_workers, len(jobs)))]
+    try:
+        for worker in workers:
+            worker.submit(pending.popleft(), extra_args, timeout)
+
+        while busy := [worker for worker in workers if worker.job is not None]:
+            ready = wait(
+                [worker.connection for worker in busy],
+                timeout=max(0., min(worker.deadline for worker in busy) - time.monotonic()),
+            )
+            for indx, worker in enumerate(workers):
+                if worker.job is None:
+                    continue
+                if worker.connection in ready:
+                    try:
+                        record, failed = worker.connection.recv(), False
+                    except EOFError:  # The worker died, e.g., killed by the OOM killer
+                        worker.process.join()
+                        record, failed = worker.failed_record(
+                            'error', f"The worker process exited with code {worker.process.exitcode}"
+                        ), True
+                elif time.monotonic() >= worker.deadline:
+                    record, failed = worker.failed_record('timeout'), True
+                else:
+                    continue
+
+                if failed:
+                    worker.kill()
+                    workers[indx] = worker = Worker()
+                else:
+                    worker.job = None
+                yield record
+
+                if pending:
+                    worker.submit(pending.popleft(), extra_args, timeout)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+def parse_batch_args(argv: Optional[List[str]] = None) -> Tuple[argparse.Namespace, List[str]]:
+    parser = argparse.ArgumentParser(
+        description="Run many contracts/targets with a pool of worker processes. Options which are not listed here "
+                    "are passed to every job, e.g., `--heuristic state_variables_based`."
+    )
+    parser.add_argument('paths', nargs='+',
+                        help="The .sol files (optionally as `path.sol:LINE` to set the target), or directories of them.")
+    parser.add_argument('--jobs', '-j', dest='jobs', type=int, default=os.cpu_count(),
+                        help="The number of worker processes.")
+    parser.add_argument('--timeout', dest='timeout', type=int, default=600,
+                        help="The timeout of each job in seconds.")
+    parser.add_argument('--results', dest='results', default=None,
+                        help="The JSON-lines file of the job results. Defaults to `output/batch-<time>.jsonl`.")
+    parser.add_argument('--clean', dest='clean_workspace', action='store_true', default=False,
+                        help="Cleans the output/ directory before running the jobs.")
+    return parser.parse_known_args(argv)
+
+
+if __name__ == '__main__':
+    batch_args, extra_args = parse_batch_args()
+
+    if batch_args.clean_workspace:
+        shutil.rmtree(OUTPUT_DIR.__str__(), ignore_errors=True)
+    OUTPUT_DIR.mkdir(exist_ok=True)
+
+    results_path = batch_args.results or OUTPUT_DIR.joinpath(
+        f"batch-{datetime.now().strftime('%Y-%m-%d-%H:%M:%S.%f')}.jsonl"
+    )
+
+    jobs = collect_jobs(batch_args.paths)
+    print(f"running {len(jobs)} jobs on {batch_args.jobs} workers, results in {results_path}", file=sys.stderr)
+
+    with open(results_path, 'w') as results_file:
+        for record in run_jobs(jobs, extra_args, batch_args.jobs, batch_args.timeout):
+            results_file.write(json.dumps(record) + '\n')
+            results_file.flush()
+
+            targets = ','.join(map(str, record['targets'])) if record['targets'] is not None else '@target'
+            mismatch = ' (unexpected result)' if record.get('matches_expected') is False else ''
+            print(f"[{record['status']}] {record['contract']}:{targets} in {record['exec_time']:.2f}s{mismatch}")
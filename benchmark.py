@@ -0,0 +1,289 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import string
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import main
+from batch import collect_jobs, expected_result
+from metrics import metrics
+
+MULTI_TX_TEMPLATE = '''pragma solidity ^0.8.0;
+
+contract multi_tx_{threshold} {{
+    uint public counter = 0;
+    uint public maximum_bid = 0;
+    uint private threshold = {threshold};
+
+    function bid(uint value) public {{
+        counter += 1;
+        if (value > maximum_bid)
+            maximum_bid = value;
+    }}
+
+    function check() public returns (uint) {{
+        if (counter == threshold)
+            return maximum_bid;  // @target maximum_bid > 100
+        return 0;
+    }}
+}}
+'''
+
+# The metrics which are compared with the baseline. The times are noisy and are compared with --tolerance, the
+# counters are deterministic and are compared with --count-tolerance.
+TIME_METRICS = ['exec_time', 'solc_select', 'slither', 'cfg_build', 'heuristic_precompute', 'search', 'solver']
+COUNT_METRICS = ['expansions', 'walk_tree_nodes', 'solver_calls']
+
+
+class Case:
+    def __init__(self, name: str, contract: str, targets: Optional[List[int]] = None, extra_args: List[str] = ()):
+        self.name = name
+        self.contract = contract
+        self.targets = targets
+        self.extra_args = list(extra_args)
+
+    @property
+    def argv(self) -> List[str]:
+        argv = [self.contract, *self.extra_args]
+        if self.targets is not None:
+            argv += ['--target', *map(str, self.targets)]
+        return argv
+
+
+def sample_cases(paths: List[str]) -> List[Case]:
+    return [
+        Case(os.path.splitext(os.path.basename(contract))[0], contract, targets)
+        for contract, targets in collect_jobs(paths)
+    ]
+
+
+def multi_tx_cases(thresholds: List[int], heuristics: List[str], directory: str) -> List[Case]:
+    """The multi_tx contract of `test_multi_tx.sh` for each threshold, which is the number of required transactions"""
+    os.makedirs(directory, exist_ok=True)
+
+    cases = []
+    for threshold in thresholds:
+        contract = os.path.join(directory, f"multi_tx_{threshold}.sol")
+        with open(contract, 'w') as f:
+            f.write(MULTI_TX_TEMPLATE.format(threshold=threshold))
+        for heuristic in heuristics:
+            cases.append(Case(f"multi_tx_{threshold}[{heuristic}]", contract, extra_args=['--heuristic', heuristic]))
+    return cases
+
+
+def run_once(argv: List[str]) -> Tuple[int, int, str, dict]:
+    """:return: (reached targets, targets, output, metrics record) Tuple of one run in this process"""
+    results = main.run(argv)
+    return sum(txs is not None for txs in results.values()), len(results), main.format_results(results), metrics.record
+
+
+def run_case(case: Case, extra_args: List[str], repeat: int) -> dict:
+    """
+    Run the case `repeat` times, and report the median of the times and the counters of the last run. Each run is in a
+    new (spawned) process, like a run from the command line, so no run reuses the imports or the in-memory caches
+    (e.g., of the IR translations) of the others. The files on disk, e.g., the PLY tables, are shared as in the command
+    line runs.
+    """
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            runs.append(executor.submit(run_once, [*case.argv, *extra_args]).result())
+
+    reached_targets, targets, output, record = runs[-1]
+    expected = expected_result(case.contract)
+    return {
+        'case': case.name,
+        'reached_targets': reached_targets,
+        'targets': targets,
+        'matches_expected': output == expected if expected is not None else None,
+        'exec_time': statistics.median(record['exec_time'] for *_, record in runs),
+        **{
+            name: statistics.median(record['times'].get(name, 0.0) for *_, record in runs)
+            for name in TIME_METRICS if name != 'exec_time'
+        },
+        'expansions': record['counters'].get('expansions', 0),
+        'walk_tree_nodes': record['counters'].get('walk_tree_nodes', 0),
+        'solver_calls': sum(record['counters'].get(result, 0) for result in ['sat', 'unsat', 'unknown']),
+        'peak_memory_mb': record['peak_memory_mb'],
+    }
+
+
+def startup_time(repeat: int) -> float:
+    """:return: The median time of `import main` in a new interpreter, i.e., the start-up before any contract is read"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import main'], check=True, cwd=directory)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def type_token_identifiers(random_identifiers: int, seed: int = 0) -> List[str]:
+    """
+    :return: The identifiers to compare `slither_ir_ply.type_token` with the manticore lexer on: the type names and
+    other words with numeric and other suffixes, the fixed/ufixed MxN combinations and random identifiers.
+    """
+    words = ['uint', 'int', 'address', 'bool', 'fixed', 'ufixed', 'bytes', 'string', 'function', 'None', 'to', 'this',
+             'x', 'interest', 'addressBook', '_a', 'u', 'b', 'f', 's']
+    suffixes = ['', *map(str, range(300)), 'x', 'x18', '128x18', '8x80', '256x81', '8x0', 'a', '_', 'Foo', '9x1', '0x',
+                '160x', '24x5z']
+    identifiers = [word + suffix for word in words for suffix in suffixes]
+    identifiers += [
+        f"{word}{m}x{n}{tail}"
+        for word in ['fixed', 'ufixed'] for m in range(0, 264, 4) for n in range(0, 90, 7) for tail in ['', 'a', '9']
+    ]
+    generator = random.Random(seed)
+    alphabet = 'uintadressboolfxdbytsgcn_0123456789'
+    identifiers += [
+        generator.choice(string.ascii_letters + '_') + ''.join(
+            generator.choice(alphabet) for _ in range(generator.randint(0, 12))
+        )
+        for _ in range(random_identifiers)
+    ]
+    return identifiers
+
+
+def check_type_tokens(identifiers: List[str]) -> List[Tuple[str, Optional[tuple], Optional[tuple]]]:
+    """
+    :return: List of (identifier, manticore token, type_token) Tuples of the identifiers which `type_token` classifies
+    differently from the ABI type lexer of manticore (0.3.7), which it replaced.
+    """
+    from manticore.ethereum.abitypes import lexer
+    from manticore.exceptions import EthereumError
+    from slither_ir_ply import type_token
+
+    def manticore_token(identifier: str) -> Optional[tuple]:
+        try:
+            lexer.input(identifier)
+            token = lexer.token()
+            return (token.type, token.value) if token else None
+        except EthereumError:  # Not a type token
+            return None
+
+    return [
+        (identifier, expected, actual)
+        for identifier in identifiers
+        if (expected := manticore_token(identifier)) != (actual := type_token(identifier))
+    ]
+
+
+def regressions(report: dict, baseline: dict, tolerance: float, count_tolerance: float,
+                min_time: float) -> List[Tuple[str, str, float, float]]:
+    """
+    :return: List of (case, metric, baseline value, new value) Tuples of the metrics which are worse than the baseline
+    by more than the tolerance. The times below `min_time` are ignored, as they are mostly noise.
+    """
+    found = []
+    for case in baseline.keys() - report.keys():  # Failed cases
+        found.append((case, 'reached_targets', baseline[case]['reached_targets'], 0))
+
+    for case, result in report.items():
+        if case not in baseline:
+            continue
+        for metric in TIME_METRICS + COUNT_METRICS:
+            old, new = baseline[case].get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if metric in TIME_METRICS:
+                if max(old, new) >= min_time and new > old * (1 + tolerance):
+                    found.append((case, metric, old, new))
+            elif new > old * (1 + count_tolerance):
+                found.append((case, metric, old, new))
+        if baseline[case].get('reached_targets', 0) > result['reached_targets']:
+            found.append((case, 'reached_targets', baseline[case]['reached_targets'], result['reached_targets']))
+    return found
+
+
+def print_table(report: Dict[str, dict]) -> None:
+    columns = ['exec_time', 'solc_select', 'slither', 'cfg_build', 'solver', 'expansions', 'walk_tree_nodes',
+               'solver_calls', 'reached_targets', 'matches_expected']
+    print(f"{'case':<40}" + ''.join(f"{column:>17}" for column in columns))
+    for case, result in report.items():
+        print(f"{case:<40}" + ''.join(
+            f"{result[column]:>17.4f}" if isinstance(result[column], float) else f"{str(result[column]):>17}"
+            for column in columns
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sample contracts and the generated multi_tx contracts, and compare the phase times, "
+                    "the walk-tree sizes and the solver calls with a baseline. Options which are not listed here are "
+                    "passed to every run."
+    )
+    parser.add_argument('paths', nargs='*', default=['sample-smart-contracts/'],
+                        help="The .sol files (optionally as `path.sol:LINE`), or directories of them.")
+    parser.add_argument('--multi-tx', dest='multi_tx', type=int, nargs='*', default=list(range(1, 9)),
+                        help="The thresholds of the generated multi_tx contracts.")
+    parser.add_argument('--multi-tx-heuristics', dest='multi_tx_heuristics', nargs='+',
+                        default=['floyd_warshall', 'state_variables_based'],
+                        help="The heuristics which the multi_tx contracts are run with.")
+    parser.add_argument('--repeat', dest='repeat', type=int, default=1,
+                        help="The number of runs of each case. The median of the times is reported.")
+    parser.add_argument('--report', dest='report', default=None,
+                        help="Store the report as JSON in this file, e.g., to use it as a baseline later.")
+    parser.add_argument('--baseline', dest='baseline', default=None,
+                        help="The report of a previous benchmark to compare with.")
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=0.25,
+                        help="The allowed relative slowdown of each time before it is a regression.")
+    parser.add_argument('--count-tolerance', dest='count_tolerance', type=float, default=0.0,
+                        help="The allowed relative increase of the expansions, walk-tree nodes and solver calls.")
+    parser.add_argument('--min-time', dest='min_time', type=float, default=0.05,
+                        help="The times (in seconds) below which the slowdowns are ignored.")
+    parser.add_argument('--startup', dest='startup', action='store_true', default=False,
+                        help="Only measure the start-up time (`import main` in a new interpreter) with the installed "
+                             "dependencies, --repeat times.")
+    parser.add_argument('--check-type-tokens', dest='check_type_tokens', type=int, nargs='?', const=200000,
+                        default=None, metavar='RANDOM_IDENTIFIERS',
+                        help="Only check that the type tokens of the IR lexer are the same as of the manticore lexer "
+                             "(requires manticore==0.3.7) on the type names and this many random identifiers.")
+    benchmark_args, extra_args = parser.parse_known_args()
+
+    if benchmark_args.check_type_tokens is not None:
+        checked = type_token_identifiers(benchmark_args.check_type_tokens)
+        mismatches = check_type_tokens(checked)
+        for identifier, expected, actual in mismatches:
+            print(f"MISMATCH {identifier}: manticore {expected}, type_token {actual}")
+        print(f"{len(checked)} identifiers, {len(mismatches)} mismatches")
+        sys.exit(1 if mismatches else 0)
+
+    if benchmark_args.startup:
+        print(f"startup {startup_time(benchmark_args.repeat):.4f}s (median of {benchmark_args.repeat})")
+        sys.exit(0)
+
+    # By default, measure the whole pipeline without the compilation cache and the exports
+    extra_args = ['--no-cache', '--export-profile', 'none', *extra_args]
+
+    cases = sample_cases(benchmark_args.paths) + multi_tx_cases(
+        benchmark_args.multi_tx, benchmark_args.multi_tx_heuristics, os.path.join('output', 'benchmark-contracts')
+    )
+
+    report = {}
+    for benchmark_case in cases:
+        print(f"running {benchmark_case.name}", file=sys.stderr)
+        try:
+            report[benchmark_case.name] = run_case(benchmark_case, extra_args, benchmark_args.repeat)
+        except Exception as e:
+            print(f"{benchmark_case.name} failed: {type(e).__name__}: {e}", file=sys.stderr)
+
+    print_table(report)
+
+    if benchmark_args.report is not None:
+        with open(benchmark_args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if benchmark_args.baseline is not None:
+        with open(benchmark_args.baseline) as f:
+            found = regressions(report, json.load(f), benchmark_args.tolerance, benchmark_args.count_tolerance,
+                                benchmark_args.min_time)
+        for case_name, metric, old_value, new_value in found:
+            print(f"REGRESSION {case_name} {metric}: {old_value} -> {new_value}")
+        sys.exit(1 if found else 0)
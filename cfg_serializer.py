@@ -0,0 +1,46 @@
+import json
+from typing import Tuple
+
+import networkx as nx
+
+CFG_FORMAT = 'griffin-cfg'
+CFG_FORMAT_VERSION = 1
+
+
+def serialize_cfg(cfg: nx.MultiDiGraph, **header) -> str:
+    """
+    Serialize the CFG into JSON lines: a header line with the format and the given `header` values, one line per node
+    with its attributes, and one line per edge with the node indices, the edge key, and the edge attributes (e.g., the
+    True/False labels). Nodes and edges are written in the graph order, so the traversal order is kept after loading.
+    """
+    node_ids = {node: indx for indx, node in enumerate(cfg.nodes)}
+
+    lines = [json.dumps({'format': CFG_FORMAT, 'version': CFG_FORMAT_VERSION, **header}, separators=(',', ':'))]
+    for node, attrs in cfg.nodes(data=True):
+        lines.append(json.dumps({'node': node, 'attrs': attrs}, separators=(',', ':')))
+    for u, v, key, attrs in cfg.edges(keys=True, data=True):
+        lines.append(json.dumps({'edge': [node_ids[u], node_ids[v], key], 'attrs': attrs}, separators=(',', ':')))
+    return '\n'.join(lines) + '\n'
+
+
+def deserialize_cfg(serialized: str) -> Tuple[nx.MultiDiGraph, dict]:
+    """
+    :return: (CFG, header) Tuple.
+    """
+    lines = serialized.splitlines()
+
+    header = json.loads(lines[0])
+    if header.pop('format', None) != CFG_FORMAT or header.pop('version', None) != CFG_FORMAT_VERSION:
+        raise ValueError(f"Unsupported CFG format, expected {CFG_FORMAT} v{CFG_FORMAT_VERSION}")
+
+    cfg = nx.MultiDiGraph()
+    nodes = []
+    for line in lines[1:]:
+        item = json.loads(line)
+        if 'node' in item:
+            nodes.append(item['node'])
+            cfg.add_node(item['node'], **item['attrs'])
+        else:
+            u, v, key = item['edge']
+            cfg.add_edge(nodes[u], nodes[v], key=key, **item['attrs'])
+    return cfg, header
@@ -1,20 +1,334 @@
+import heapq
+import multiprocessing
 import re
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import OrderedDict, defaultdict, deque
 from functools import cached_property
-from typing import Callable, Optional, List
+from typing import Callable, Optional, List, Dict, Tuple
 
 import networkx as nx
-from z3 import Solver, sat
+from z3 import Solver, sat, unsat, unknown, Bool, BoolRef, Const, ExprRef, Implies, is_true, Then, Cond, Probe, \
+    Tactic, Z3_OP_UNINTERPRETED, is_app, is_const, is_eq, is_quantifier, simplify, substitute
 
 import utils
-from slither_ir_ply import SlitherIR, SymbolTableManager, symbol_table_manager
+from metrics import metrics
+from slither_ir_ply import SlitherIR, symbol_table_manager, ir_translation_cache
+
+
+def flatten_constraints(constraints: list) -> list:
+    """The constraints of the IR expressions, without the lists of the ignored expressions like `Emit`"""
+    return [
+        item for constraint in constraints
+        for item in (constraint if isinstance(constraint, list) else [constraint])
+    ]
+
+
+# The IR expressions of the path conditions, which are the roots of the constraint slicing
+PATH_CONDITION_REGEX = re.compile(r'^CONDITION\s|SOLIDITY_CALL (require|assert)\(')
+SSA_NAME_REGEX = re.compile(r'^(?P<symbol>.+)_(?P<index>\d+)$')
+
+
+def constraint_symbols(constraint: ExprRef) -> frozenset:
+    """The names of the uninterpreted constants and functions of the constraint, e.g., the SSA variables"""
+    symbols, visited, stack = set(), set(), [constraint]
+    while stack:
+        item = stack.pop()
+        if item.get_id() in visited:
+            continue
+        visited.add(item.get_id())
+
+        if is_quantifier(item):
+            stack.append(item.body())
+        elif is_app(item):
+            if item.decl().kind() == Z3_OP_UNINTERPRETED:
+                symbols.add(item.decl().name())
+            stack.extend(item.children())
+    return frozenset(symbols)
+
+
+def ssa_constants(constraint: ExprRef) -> List[ExprRef]:
+    """The SSA variables of the constraint, i.e., the uninterpreted constants named `<symbol>_<SSA index>`"""
+    constants, visited, stack = [], set(), [constraint]
+    while stack:
+        item = stack.pop()
+        if item.get_id() in visited:
+            continue
+        visited.add(item.get_id())
+
+        if is_quantifier(item):
+            stack.append(item.body())
+        elif is_const(item) and item.decl().kind() == Z3_OP_UNINTERPRETED:
+            if SSA_NAME_REGEX.match(item.decl().name()):
+                constants.append(item)
+        elif is_app(item):
+            stack.extend(item.children())
+    return constants
+
+
+def defined_symbol(constraint: ExprRef) -> Optional[str]:
+    """The SSA variable which the constraint defines, if it is `variable == expression`"""
+    if is_eq(constraint) and is_const(constraint.arg(0)) and constraint.arg(0).decl().kind() == Z3_OP_UNINTERPRETED:
+        return constraint.arg(0).decl().name()
+    return None
+
+
+SOLVER_TACTICS = ['default', 'bit-blast', 'qfbv']
+
+
+def new_solver(tactic: str = 'default', timeout: Optional[int] = None) -> Solver:
+    """
+    A solver of the tactic pipeline: the default z3 solver, simplify→solve-eqs→bit-blast→sat (bit-blast), which falls
+    back to the `smt` tactic for the formulas which are not QF_BV (e.g., with quantifiers or Ints), or z3's qfbv. The
+    checks which take more than the timeout (in milliseconds) are `unknown`.
+    """
+    if tactic == 'default':
+        solver = Solver()
+    elif tactic == 'bit-blast':
+        solver = Then('simplify', 'solve-eqs', Cond(Probe('is-qfbv'), Then('bit-blast', 'sat'), 'smt')).solver()
+    elif tactic == 'qfbv':
+        solver = Tactic('qfbv').solver()
+    else:
+        raise ValueError(f"Unknown solver tactic {tactic}")
+
+    if timeout:
+        solver.set(timeout=timeout)
+    return solver
+
+
+def check_smt2(smt2: str, literal_names: List[str], tactic: str = 'default',
+               timeout: Optional[int] = None) -> Tuple[str, List[str], float, Optional[str]]:
+    """
+    Check the SMT-LIB script of a path in a worker process, which has its own z3 context.
+
+    :return: The result, the names of the literals in the unsat core, the solve time, and the reason of an unknown
+    """
+    solver = new_solver(tactic, timeout)
+    solver.from_string(smt2)
+
+    start_time = time.perf_counter()
+    result = solver.check(*[Bool(name) for name in literal_names])
+    solve_time = time.perf_counter() - start_time
+
+    core = [str(literal) for literal in solver.unsat_core()] if result == unsat and literal_names else []
+    return str(result), core, solve_time, solver.reason_unknown() if result == unknown else None
+
+
+class IncrementalSolver:
+    """
+    A single z3 solver shared by all the paths of a walk tree. The constraints of each path segment are asserted once,
+    guarded by an assumption literal, and a path is checked by assuming the literals of all of its segments. The
+    segments are never retracted, so once their number doubles, the solver is rebuilt from the live segments only (see
+    `rebuild`).
+    """
+
+    LITERAL_PREFIX = '__walk_segment_'
+    MIN_REBUILD_SEGMENTS = 1024
+
+    def __init__(self, tactic: str = 'default'):
+        self.tactic = tactic
+        self.solver = new_solver(tactic)
+        self.__last_literal = -1
+        self.__segments: Dict[str, Tuple[BoolRef, list]] = {}  # The (literal, constraints) of each asserted segment
+        self.__rebuild_size = self.MIN_REBUILD_SEGMENTS
+
+    def __len__(self):
+        return len(self.__segments)
+
+    def add_segment(self, constraints: list) -> BoolRef:
+        self.__last_literal += 1
+        literal = Bool(f"{self.LITERAL_PREFIX}{self.__last_literal}")
+
+        self.__segments[str(literal)] = (literal, flatten_constraints(constraints))
+        for constraint in self.__segments[str(literal)][1]:
+            self.solver.add(Implies(literal, constraint))
+
+        return literal
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return len(self.__segments) >= self.__rebuild_size
+
+    def rebuild(self, live_literals: set) -> None:
+        """
+        Assert only the live segments (by the names of their literals) in a new solver, e.g., of the paths to the
+        frontiers, and drop the segments of the infeasible, pruned and expanded paths.
+        """
+        self.__segments = {name: segment for name, segment in self.__segments.items() if name in live_literals}
+        self.solver = new_solver(self.tactic)
+        for literal, constraints in self.__segments.values():
+            for constraint in constraints:
+                self.solver.add(Implies(literal, constraint))
+
+        self.__rebuild_size = max(self.MIN_REBUILD_SEGMENTS, 2 * len(self.__segments))
+        metrics.count('incremental_solver_rebuilds')
+
+    def check(self, assumptions, timeout: Optional[int] = None):
+        if timeout:  # Otherwise the default timeout (e.g., of a batch job) is kept
+            self.solver.set(timeout=timeout)
+        return self.solver.check(*assumptions)
+
+
+class UnsatCores:
+    """
+    The unsat cores of the infeasible paths of a walk tree. Each core is the set of the conflicting constraints with the
+    CFG nodes which they come from. The constraints are SSA-renamed, so the same node set is not necessarily in conflict
+    on another path (e.g., with a write between the nodes). Hence, a path is pruned only if it contains the nodes and
+    the very same constraints of a core, which z3 hash-conses, so they are compared by their AST ids.
+    """
+
+    def __init__(self):
+        self.__cores: List[Tuple[frozenset, frozenset]] = []  # (CFG nodes, constraint ids) tuples
+        self.__constraints: List[ExprRef] = []  # Keeps the core constraints alive, as z3 reuses the freed AST ids
+
+    def __len__(self):
+        return len(self.__cores)
+
+    def add(self, core: List[Tuple[str, ExprRef]]) -> None:
+        nodes = frozenset(node for node, _ in core)
+        constraint_ids = frozenset(constraint.get_id() for _, constraint in core)
+        if constraint_ids and (nodes, constraint_ids) not in self.__cores:
+            self.__cores.append((nodes, constraint_ids))
+            self.__constraints.extend(constraint for _, constraint in core)
+
+    def find(self, cfg_path: 'CFGPath') -> Optional[frozenset]:
+        """:return: The CFG nodes of a core which is contained in the path, or `None`"""
+        if not self.__cores:
+            return None
+
+        nodes = set(cfg_path.nodes)
+        constraint_ids = None  # Only collected if the nodes of a core are on the path
+        for core_nodes, core_constraint_ids in self.__cores:
+            if core_nodes <= nodes:
+                if constraint_ids is None:
+                    constraint_ids = {constraint.get_id() for _, constraint in cfg_path.tracked_constraints}
+                if core_constraint_ids <= constraint_ids:
+                    return core_nodes
+        return None
+
+
+class InfeasibleStates:
+    """
+    The infeasible states of a walk tree by their last nodes. Each state is the unsat core (or all the constraints,
+    without a core) of an UNSAT path, projected onto the live SSA variables at its last node: each SSA variable is
+    renamed by its distance from the live version of its symbol (see `CFGPath.renamed_to_live`). The renaming is
+    injective, so a path at the same node whose renamed constraints contain a state is UNSAT too, even if it has more SSA
+    versions, e.g., after one more cycle through a loop or a transaction which does not change the state.
+    """
+
+    def __init__(self):
+        self.__states: Dict[str, List[frozenset]] = defaultdict(list)  # The renamed constraint ids of each node
+        self.__constraints: List[ExprRef] = []  # Keeps the renamed constraints alive, as z3 reuses the freed AST ids
+
+    def __len__(self):
+        return sum(len(states) for states in self.__states.values())
+
+    def add(self, cfg_path: 'CFGPath') -> None:
+        if cfg_path.unsat_core is not None:
+            constraints = [constraint for _, constraint in cfg_path.unsat_core]
+        else:
+            constraints = [constraint for _, constraint in cfg_path.tracked_constraints]
+        renamed = [constraint for constraint in cfg_path.renamed_to_live(constraints) if not is_true(constraint)]
+
+        state = frozenset(constraint.get_id() for constraint in renamed)
+        if state not in self.__states[cfg_path.last_node]:
+            self.__states[cfg_path.last_node].append(state)
+            self.__constraints.extend(renamed)
+
+    def find(self, cfg_path: 'CFGPath') -> bool:
+        """Whether the path contains an infeasible state of its last node"""
+        if not (states := self.__states.get(cfg_path.last_node)):
+            return False
+
+        renamed = cfg_path.renamed_to_live([constraint for _, constraint in cfg_path.tracked_constraints])
+        constraint_ids = {constraint.get_id() for constraint in renamed}  # Compared while `renamed` is alive
+        return any(state <= constraint_ids for state in states)
+
+
+class VisitedStates:
+    """
+    LRU index of the states (see `CFGPath.state_signature`) which are already expanded by the walk tree. A path which
+    reaches a visited state is redundant, as its walks are the same as the walks of the visited one. The evicted states
+    are only expanded again.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.__states = OrderedDict()
+
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__states)
+
+    def __contains__(self, state: tuple) -> bool:
+        if state in self.__states:
+            self.hits += 1
+            self.__states.move_to_end(state)
+            return True
+        return False
+
+    def peek(self, state: tuple) -> bool:
+        """Whether the state is visited, without counting a hit or refreshing it"""
+        return state in self.__states
+
+    def add(self, state: tuple) -> None:
+        self.__states[state] = None
+        if len(self.__states) > self.maxsize:
+            self.__states.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def stats(self) -> str:
+        return f"hits={self.hits}, evictions={self.evictions}, size={len(self)}/{self.maxsize}"
 
 
 class CFGPath:
+    CORE_LITERAL_PREFIX = '__core_'
+    TIMEOUT_REASONS = ('timeout', 'canceled')  # The `reason_unknown` of the checks which are stopped by the timeout
+
     def __init__(self, cfg: nx.MultiDiGraph, *args, **kwargs):
         self.cfg = cfg
-        self.nodes = args
+
+        # The path is stored as a persistent prefix: the parent path is shared and only the appended nodes, their
+        # expressions, and their constraints are kept by this path.
+        self.parent: CFGPath | None = kwargs.get('parent', None)
+        self.own_nodes = args
+        self.depth = len(args) + (self.parent.depth if self.parent is not None else 0)
 
         self._variables = kwargs.get('variables', None)
+        self.incremental_solver: IncrementalSolver | None = kwargs.get('incremental_solver', None)
+        self.track_unsat_core: bool = kwargs.get('track_unsat_core', False)
+        self.solver_tactic: str = kwargs.get('solver_tactic', 'default')
+        self.solver_timeout: int | None = kwargs.get('solver_timeout', None)
+        self.slice_constraints: bool = kwargs.get('slice_constraints', False)
+
+        self.solve_time = None
+        self._model = None
+        self.unsat_core: List[Tuple[str, ExprRef]] | None = None  # The (CFG node, constraint) tuples of the core
+        self.remote_result: Tuple[str, List[str], float, str | None] | None = None  # The result of `check_smt2`
+        self.is_unknown = False  # The last check is neither SAT nor UNSAT
+        self.unknown_reason: str | None = None
+        self.unknown_results = 0
+
+    def __segments(self) -> list:
+        """The paths from the root path to this one"""
+        segments = []
+        cfg_path = self
+        while cfg_path is not None:
+            segments.append(cfg_path)
+            cfg_path = cfg_path.parent
+        return list(reversed(segments))
+
+    @property
+    def nodes(self) -> tuple:
+        return tuple(node for segment in self.__segments() for node in segment.own_nodes)
+
+    @property
+    def last_node(self) -> str:
+        return self.own_nodes[-1] if self.own_nodes else self.parent.last_node
 
     def __get_irs(self, node):
         return self.cfg.nodes[node].get("irs", [])
@@ -22,59 +336,329 @@ class CFGPath:
     def __get_reversed_irs(self, node):
         return list(reversed(self.__get_irs(node)))
 
-    def __get_prev_edge(self, node_index: int) -> Optional[str]:
-        if node_index == 0:
-            return None
+    def __get_prev_edge(self, own_node_index: int) -> Optional[str]:
+        if own_node_index == 0:
+            if self.parent is None:
+                return None
+            prev_node = self.parent.last_node
+        else:
+            prev_node = self.own_nodes[own_node_index - 1]
         return self.cfg.get_edge_data(
-            self.nodes[node_index - 1],
-            self.nodes[node_index],
+            prev_node,
+            self.own_nodes[own_node_index],
         )[0]['label']
 
+    def __node_expressions(self, own_node_index: int) -> List[str]:
+        node = self.own_nodes[own_node_index]
+        # TODO: Also do this about for statements
+        if self.cfg.nodes[node].get('node_type') == "IF" and self.__get_prev_edge(own_node_index) == 'False':
+            return list(map(
+                lambda expr: expr if 'CONDITION' not in expr else expr.replace("CONDITION", "CONDITION NOT"),
+                self.__get_reversed_irs(node),
+            ))
+        return self.__get_reversed_irs(node)  # Reversing is required to have correct backward path
+
     @cached_property
-    def expressions(self):
+    def own_expressions(self) -> List[str]:
+        """The expressions which are not shared with the parent path"""
         res = []
-        for indx, node in enumerate(self.nodes):
-            # TODO: Also do this about for statements
-            if self.cfg.nodes[node].get('node_type') == "IF" and self.__get_prev_edge(indx) == 'False':
-                res.extend(
-                    map(
-                        lambda expr: expr if 'CONDITION' not in expr else expr.replace("CONDITION", "CONDITION NOT"),
-                        self.__get_reversed_irs(node),
-                    )
-                )
-            else:
-                res.extend(self.__get_reversed_irs(node))  # Reversing is required to have correct backward path
+        for indx in range(len(self.own_nodes)):
+            res.extend(self.__node_expressions(indx))
         return res
 
+    @cached_property
+    def own_expression_nodes(self) -> List[str]:
+        """The CFG node of each of the own expressions"""
+        return [node for indx, node in enumerate(self.own_nodes) for _ in self.__node_expressions(indx)]
+
+    @property
+    def expressions(self):
+        return [expr for segment in self.__segments() for expr in segment.own_expressions]
+
     @cached_property
     def variables(self):
         return self._variables
 
     @cached_property
+    def own_constraints(self):
+        """The constraints which are not shared with the parent path"""
+        if self.parent is not None:
+            _ = self.parent.own_constraints  # The SSA symbols of the parent are required
+            symbol_table_manager.clear_table()
+            symbol_table_manager.set_types(self.variables)
+            symbol_table_manager.set_symbols(self.parent.ssa_symbols)
+        else:
+            symbol_table_manager.clear_table()
+            symbol_table_manager.set_types(self.variables)
+
+        res = [SlitherIR(expr).constraints for expr in self.own_expressions]
+        self.ssa_symbols = symbol_table_manager.symbols.copy()
+        return res
+
+    @property
     def constraints(self):
-        SymbolTableManager.get_instance().clear_table()
-        SymbolTableManager.get_instance().set_types(self.variables)
+        return [constraint for segment in self.__segments() for constraint in segment.own_constraints]
+
+    @cached_property
+    def own_tracked_constraints(self) -> List[Tuple[str, ExprRef]]:
+        """The flattened own constraints with their CFG nodes, which are the labels of the constraints in unsat cores"""
+        return [
+            (node, item) for node, constraint in zip(self.own_expression_nodes, self.own_constraints)
+            for item in flatten_constraints([constraint])
+        ]
+
+    @property
+    def tracked_constraints(self) -> List[Tuple[str, ExprRef]]:
+        return [constraint for segment in self.__segments() for constraint in segment.own_tracked_constraints]
 
-        return [SlitherIR(expr).constraints for expr in self.expressions]
+    @cached_property
+    def own_slicing_info(self) -> List[Tuple[frozenset, Optional[str], ExprRef]]:
+        """
+        The symbols, the defined SSA variable (`None` for the path conditions), and the simplified form of each of the
+        own tracked constraints
+        """
+        conditions = {
+            item.get_id() for expr, constraint in zip(self.own_expressions, self.own_constraints)
+            if PATH_CONDITION_REGEX.search(expr) for item in flatten_constraints([constraint])
+        }
+        return [
+            (
+                constraint_symbols(constraint),
+                defined_symbol(constraint) if constraint.get_id() not in conditions else None,
+                simplify(constraint),
+            )
+            for _, constraint in self.own_tracked_constraints
+        ]
 
     @cached_property
-    def solver(self):
-        solver = Solver()
-        for constraint in self.constraints:
-            solver.add(constraint)
-        return solver
+    def __slice(self) -> Tuple[List[Tuple[int, ExprRef]], int, int]:
+        """
+        The cone of influence of the path: the (index, simplified constraint) Tuples of the tracked constraints which
+        are the path conditions, the other constraints which are not definitions (e.g., of `msg.sender`), and the
+        definitions of the SSA variables which they depend on. The definitions out of the cone hold for any values of
+        the cone, so they are dropped, as well as the trivial constraints.
+
+        :return: The cone, the number of the trivial constraints, and the number of the sliced definitions
+        """
+        slicing_info = [info for segment in self.__segments() for info in segment.own_slicing_info]
+
+        roots, definitions, trivial = [], defaultdict(list), 0
+        for indx, (_, symbol, simplified) in enumerate(slicing_info):
+            if is_true(simplified):
+                trivial += 1
+            elif symbol is None:
+                roots.append(indx)
+            else:
+                definitions[symbol].append(indx)
+        for symbol in [symbol for symbol, indices in definitions.items() if len(indices) > 1]:
+            roots.extend(definitions.pop(symbol))  # Constrained more than once, so not only a definition
+
+        kept, visited = set(roots), set()
+        stack = [symbol for indx in roots for symbol in slicing_info[indx][0]]
+        while stack:
+            if (symbol := stack.pop()) in visited:
+                continue
+            visited.add(symbol)
+            for indx in definitions.get(symbol, []):
+                kept.add(indx)
+                stack.extend(slicing_info[indx][0])
+
+        cone = [(indx, slicing_info[indx][2]) for indx in sorted(kept)]
+        return cone, trivial, len(slicing_info) - trivial - len(kept)
+
+    @cached_property
+    def state_signature(self) -> tuple:
+        """
+        The last node, the SSA indices, and the constraints (by their hash-consed z3 AST ids, without the trivial ones)
+        of the path. The paths with the same signature have the same formula, and the same walks from here on.
+        """
+        _ = self.own_constraints  # The SSA symbols are set by the translation
+        return (
+            self.last_node,
+            tuple(sorted(self.ssa_symbols.items())),
+            frozenset(
+                constraint.get_id() for constraint in flatten_constraints(self.constraints) if not is_true(constraint)
+            ),
+        )
+
+    def renamed_to_live(self, constraints: List[ExprRef]) -> List[ExprRef]:
+        """
+        The constraints with each SSA variable renamed by its distance from the live version of its symbol at the last
+        node of the path, e.g., `x_5` is `x@0` and `x_4` is `x@1` if the SSA index of `x` is 5 here. The renaming is
+        injective, so it keeps an UNSAT formula UNSAT.
+        """
+        _ = self.own_constraints  # The SSA symbols are set by the translation
+        renamed = {}  # By the AST ids of the SSA variables
+        for constant in (constant for constraint in constraints for constant in ssa_constants(constraint)):
+            if constant.get_id() not in renamed:
+                matched = SSA_NAME_REGEX.match(constant.decl().name())
+                symbol, index = matched.group('symbol'), int(matched.group('index'))
+                renamed[constant.get_id()] = (
+                    constant, Const(f"{symbol}@{self.ssa_symbols.get(symbol, 0) - index}", constant.sort())
+                )
+        return [substitute(constraint, *renamed.values()) if renamed else constraint for constraint in constraints]
+
+    @cached_property
+    def own_assumption(self) -> BoolRef:
+        """The assumption literal of the constraints of this path segment in the incremental solver"""
+        return self.incremental_solver.add_segment(self.own_constraints)
+
+    @property
+    def assumptions(self) -> list:
+        return [segment.own_assumption for segment in self.__segments()]
+
+    @property
+    def asserted_assumptions(self) -> list:
+        """The assumption literals of the segments which are already asserted in the incremental solver"""
+        return [segment.own_assumption for segment in self.__segments() if 'own_assumption' in segment.__dict__]
+
+    def __solver(self, timeout: Optional[int] = None) -> Tuple[Solver, List[BoolRef]]:
+        """A new solver of the path constraints, with the assumption literals of the labelled constraints, if any"""
+        solver = new_solver(self.solver_tactic, timeout)
+        literals = []
+        if self.slice_constraints:
+            constraints, *_ = self.__slice
+        else:
+            constraints = [(indx, constraint) for indx, (_, constraint) in enumerate(self.tracked_constraints)]
+
+        for indx, constraint in constraints:
+            if self.track_unsat_core:  # Each constraint is labelled by an assumption literal
+                literals.append(Bool(f"{self.CORE_LITERAL_PREFIX}{indx}"))
+                solver.add(Implies(literals[-1], constraint))
+            else:
+                solver.add(constraint)
+        return solver, literals
+
+    def __core_of(self, literal_names: List[str]) -> List[Tuple[str, ExprRef]]:
+        tracked_constraints = self.tracked_constraints
+        return [tracked_constraints[int(name[len(self.CORE_LITERAL_PREFIX):])] for name in literal_names]
+
+    def smt2_query(self) -> Tuple[str, List[str]]:
+        """The constraints as an SMT-LIB script with the names of the assumption literals, for `check_smt2`"""
+        solver, literals = self.__solver()
+        return solver.sexpr(), [str(literal) for literal in literals]
 
     @cached_property
     def is_sat(self):
-        return self.solver.check() == sat
+        with metrics.timer('is_sat'):  # Includes translating the constraints, unless the debug log did it before
+            if self.remote_result is not None:  # Checked by a worker process, the model is found on demand
+                result, core, self.solve_time, self.unknown_reason = self.remote_result
+                if result == 'unsat' and self.track_unsat_core:
+                    self.unsat_core = self.__core_of(core)
+                result = {'sat': sat, 'unsat': unsat}.get(result, unknown)
+                solver = None
+            elif self.incremental_solver is not None:
+                assumptions = self.assumptions  # Assert the new constraints before measuring the solve time
+
+                start_time = time.perf_counter()
+                result = self.incremental_solver.check(assumptions, self.solver_timeout)
+                self.solve_time = time.perf_counter() - start_time
+
+                solver = self.incremental_solver.solver
+                if result == unsat and self.track_unsat_core:
+                    segments = {str(segment.own_assumption): segment for segment in self.__segments()}
+                    self.unsat_core = [
+                        constraint for literal in solver.unsat_core()
+                        for constraint in segments[str(literal)].own_tracked_constraints
+                    ]
+            else:
+                solver, literals = self.__solver(self.solver_timeout)
+
+                start_time = time.perf_counter()
+                result = solver.check(*literals)
+                self.solve_time = time.perf_counter() - start_time
+
+                if result == unsat and self.track_unsat_core:
+                    self.unsat_core = self.__core_of([str(literal) for literal in solver.unsat_core()])
+
+            metrics.add_time('solver', self.solve_time)
+            metrics.count(str(result))
+            if self.slice_constraints and self.unknown_results == 0:  # Once per path, not per recheck or query
+                _, trivial, sliced = self.__slice
+                metrics.count('trivial_constraints', trivial)
+                metrics.count('sliced_constraints', sliced)
+            if self.unsat_core == []:  # The tactic solvers have no unsat cores
+                self.unsat_core = None
+            if result == unknown:
+                self.is_unknown = True
+                self.unknown_results += 1
+                if solver is not None:
+                    self.unknown_reason = solver.reason_unknown()
+
+            # The model is kept instead of the solver, as the shared solver will be checked for other paths
+            self._model = solver.model() if result == sat and solver is not None else None
+            return result == sat
+
+    @cached_property
+    def is_sat_at_full_width(self) -> bool:
+        """
+        Whether the path is SAT without the arithmetic abstraction, which is not exact (e.g., the `int` one has no
+        wrap-around). The model is replaced by the full-width one, so the inputs are of the full-width check. An
+        unknown result is not SAT, but the path is unknown as by `is_sat`.
+        """
+        if symbol_table_manager.arithmetic_abstraction == 'none':
+            return self.is_sat
+
+        with metrics.timer('full_width_check'), symbol_table_manager.abstraction('none'):
+            symbol_table_manager.clear_table()
+            symbol_table_manager.set_types(self.variables)
+            solver = new_solver(self.solver_tactic, self.solver_timeout)
+            for expr in self.expressions:
+                solver.add(SlitherIR(expr).constraints)
+
+            start_time = time.perf_counter()
+            result = solver.check()
+            metrics.add_time('solver', time.perf_counter() - start_time)
+            metrics.count('full_width_checks')
+
+        if result == unknown:
+            self.is_unknown = True
+            self.unknown_results += 1
+            self.unknown_reason = solver.reason_unknown()
+        self._model = solver.model() if result == sat else None
+        self.__dict__.pop('sat_inputs', None)  # Of the abstract model, if it is logged before
+        return result == sat
+
+    def recheck(self, timeout: Optional[int]) -> None:
+        """Forget the unknown result, so the path is checked again with the new timeout"""
+        for checked in ['is_sat_at_full_width', 'sat_inputs']:
+            self.__dict__.pop(checked, None)
+        if self.__dict__.get('is_sat') is not True:  # Unless only the full-width check is unknown
+            self.__dict__.pop('is_sat', None)
+        self.remote_result = None
+        self.is_unknown = False
+        self.unknown_reason = None
+        self.solver_timeout = timeout
+
+    @property
+    def is_checked(self) -> bool:
+        return 'is_sat' in self.__dict__ or self.remote_result is not None
+
+    @property
+    def timed_out(self) -> bool:
+        """Whether the last check is unknown by the timeout, not by an incomplete theory (e.g., of quantifiers)"""
+        return self.is_unknown and bool(self.solver_timeout) and self.unknown_reason in self.TIMEOUT_REASONS
 
     @cached_property
     def sat_inputs(self):
         if self.is_sat is False:
             return []
         else:
-            model = self.solver.model()
-            return {value.name(): model[value] for value in model}
+            if self._model is None:  # Checked by a worker process
+                solver, literals = self.__solver()
+                solver.check(*literals)
+                self._model = solver.model()
+            inputs = {
+                value.name(): self._model[value] for value in self._model
+                if not value.name().startswith((IncrementalSolver.LITERAL_PREFIX, self.CORE_LITERAL_PREFIX))
+            }
+            if self.incremental_solver is not None:  # The shared model also assigns the symbols of the other paths
+                symbols = {
+                    symbol for constraint in flatten_constraints(self.constraints)
+                    for symbol in constraint_symbols(constraint)
+                }
+                inputs = {name: value for name, value in inputs.items() if name in symbols}
+            return inputs
 
     @cached_property
     def txs(self) -> List | None:
@@ -83,7 +667,7 @@ class CFGPath:
 
         _txs = []
         _nodes = list(reversed(list(self.nodes)))
-        _symbols = symbol_table_manager.symbols.copy()
+        _symbols = self.ssa_symbols.copy()
         for prev, cur, nxt in zip(_nodes, _nodes[1:], _nodes[2:]):
             # TODO: Maybe add default constructor
             if prev in ['AFTER_CREATION', "START_NODE"] and cur != "AFTER_CREATION":
@@ -101,23 +685,29 @@ class CFGPath:
         return _txs
 
     @cached_property
-    def not_written_variables(self) -> List:
-        rw = {}
-        for node in self.nodes:
+    def read_write_counts(self) -> dict:
+        """The number of reads of each state variable after its last write on the path"""
+        rw = self.parent.read_write_counts.copy() if self.parent is not None else {}
+        for node in self.own_nodes:
             for var in self.cfg.nodes[node].get('state_variables_read', []):
                 if var not in rw.keys():
                     rw[var] = 0
                 rw[var] += 1
             for var in self.cfg.nodes[node].get('state_variables_written', []):
                 rw[var] = 0
-        return [var for var in rw.keys() if rw[var] > 0]
+        return rw
+
+    @cached_property
+    def not_written_variables(self) -> List:
+        return [var for var, count in self.read_write_counts.items() if count > 0]
 
 
 class Heuristic:
     @staticmethod
     def get_instance(graph: nx.MultiDiGraph, name: str = "floyd_warshall"):
         return {
-            "floyd_warshall": FloydWarshall,
+            "floyd_warshall": ShortestDistance,  # The name of the former all-pairs implementation
+            "shortest_distance": ShortestDistance,
             "state_variables_based": StateVariablesBasedHeuristic,
         }.get(name)(graph)
 
@@ -128,17 +718,42 @@ class Heuristic:
         raise NotImplementedError
 
 
-class FloydWarshall(Heuristic):
+class ShortestDistance(Heuristic):
+    """
+    The length of the shortest path from `s` to `t` on the graph. Only the distances to the queried targets, i.e., the
+    entry point, are computed by a BFS over the incoming edges of the target.
+    """
+
     def __init__(self, graph: nx.MultiDiGraph):
         super().__init__(graph)
 
-        self._floyd_warshall_result = nx.floyd_warshall(self._graph)
+        self._node_ids = {node: indx for indx, node in enumerate(self._graph.nodes)}
+        self._distances = {}  # The distances to each target, indexed by the node ids
+
+    def __distances_to(self, t: str) -> array:
+        distances = array('d', [float('inf')] * len(self._node_ids))
+        distances[self._node_ids[t]] = 0
+
+        queue = deque([t])
+        while queue:
+            node = queue.popleft()
+            for predecessor in self._graph.predecessors(node):
+                if distances[self._node_ids[predecessor]] == float('inf'):
+                    distances[self._node_ids[predecessor]] = distances[self._node_ids[node]] + 1
+                    queue.append(predecessor)
+        return distances
+
+    def _distance(self, s: str, t: str) -> float:
+        if t not in self._distances:
+            with metrics.timer('heuristic_precompute'):
+                self._distances[t] = self.__distances_to(t)
+        return self._distances[t][self._node_ids[s]]
 
     def fitness(self, s: str, t: str, **extra):
-        return self._floyd_warshall_result[s][t]
+        return self._distance(s, t)
 
 
-class StateVariablesBasedHeuristic(FloydWarshall):
+class StateVariablesBasedHeuristic(ShortestDistance):
     def __init__(self, graph: nx.MultiDiGraph):
         super().__init__(graph)
 
@@ -149,35 +764,105 @@ class StateVariablesBasedHeuristic(FloydWarshall):
                     set(current_walk.not_written_variables) &
                     set(self._graph.nodes[s].get('func_state_variables_written'))
             ):
-                return self._floyd_warshall_result[s][t]
+                return self._distance(s, t)
             else:
                 return float('inf')
-        return self._floyd_warshall_result[s][t]
+        return self._distance(s, t)
 
 
 class WalkTree:
-    def __init__(self, contract, reversed_cfg: nx.MultiDiGraph, target_node: str, entry_point: str = 'START_NODE'):
+    """
+    The walk tree of the backward search from the target nodes to the entry point. Each target is a root of the walk
+    tree, and all the roots share one frontier, so the CFG, the heuristic tables, and the IR translations are shared
+    between the targets.
+    """
+
+    def __init__(self, contract, reversed_cfg: nx.MultiDiGraph, target_nodes: List[str],
+                 entry_point: str = 'START_NODE'):
         self.contract = contract
         self.reversed_cfg = reversed_cfg
-        self.target_node = target_node
+        self.target_nodes = list(dict.fromkeys(target_nodes))  # Without duplicates
         self.entry_point = entry_point
 
-        self.__walk_tree = nx.DiGraph()
-        self.__last_node = -1
-        self.__add_node(self.target_node)  # Add the walk-tree root
+        # The walk tree is stored as parent-pointer columns, indexed by the walk-tree node ids
+        self.__rev_cfg_node_names = list(self.reversed_cfg.nodes)
+        self.__rev_cfg_node_ids = {name: indx for indx, name in enumerate(self.__rev_cfg_node_names)}
+        self.__parents = array('l')
+        self.__depths = array('l')
+        self.__rev_cfg_nodes = array('l')
+        self.__roots = array('l')  # The index of the target (in target_nodes) which the walk-tree node belongs to
+        self.__transactions = array('l')  # The number of the transactions (without the constructor) on the path
+        self.__paths: List[CFGPath] = []  # The path of each walk-tree node, sharing the path of its parent
 
-        # TODO: Use better data-structure for __frontiers later. Maybe min-heap
-        self.__frontiers = [0, ]  # Only the target node for start
+        from arg_parser import args
+        self.__solver_tactic = args.solver_tactic
+        self.__solver_timeout = args.solver_timeout
+        self.__solver_timeout_retries = args.solver_timeout_retries
+        self.__dropped_unknowns = 0
+        self.__incremental_solver = IncrementalSolver(self.__solver_tactic) if args.incremental_solving else None
+        self.__unsat_cores = UnsatCores() if args.unsat_core_pruning else None
+        self.__parallel_checks = args.parallel_checks
+        if self.__parallel_checks > 1 and self.__incremental_solver is not None:
+            utils.log("--parallel-checks is ignored with --incremental-solving, as the paths share one solver",
+                      level='warning')
+            self.__parallel_checks = 1
+        self.__slice_constraints = args.slice_constraints
+        if self.__slice_constraints and self.__incremental_solver is not None:
+            utils.log("--slice-constraints is ignored with --incremental-solving, as the segments are asserted once",
+                      level='warning')
+            self.__slice_constraints = False
+        self.__portfolio = args.solver_portfolio or []
+        if self.__portfolio and (self.__parallel_checks > 1 or self.__incremental_solver is not None):
+            utils.log("--solver-portfolio is ignored with --parallel-checks and --incremental-solving",
+                      level='warning')
+            self.__portfolio = []
+        if self.__portfolio and not self.__solver_timeout:  # The workers would be stuck in the slower checks
+            utils.log("--solver-portfolio is ignored without --solver-timeout, as the losing checks are not "
+                      "interrupted", level='warning')
+            self.__portfolio = []
+        ir_translation_cache.maxsize = args.ir_cache_size
+        symbol_table_manager.set_mapping_encoding(args.mapping_encoding)
+        symbol_table_manager.set_arithmetic_abstraction(args.arithmetic_abstraction)
+
+        self.__max_transactions = args.max_transactions
+        self.__max_loop_iterations = args.max_loop_iterations
+        self.__bound_hits = {'transactions': 0, 'loop_iterations': 0}
+
+        # The signatures of the UNSAT paths. The paths are kept by the walk tree, so the AST ids are not reused.
+        self.__infeasible_states = InfeasibleStates() if args.cache_infeasible_states else None
+        self.__visited_states = VisitedStates(args.visited_states_size) if args.visited_states_size > 0 else None
 
-    def __add_node(self, node_name: str, parent: int = None) -> int:
-        self.__last_node += 1
+        # Min-heap of (unknown results, fitness, walk-tree node) tuples. The fitness is computed once, when the node is
+        # inserted, and ties are broken by the insertion order of the walk-tree nodes. The paths which timed out are
+        # after all the others.
+        self.__frontiers = []
+        for root, target_node in enumerate(self.target_nodes):  # Only the target nodes for start
+            self.__push_frontier(self.__add_node(target_node, root=root))
 
-        self.__walk_tree.add_node(self.__last_node, name_on_rev_cfg=node_name)
+    def __add_node(self, node_name: str, parent: int = None, root: int = None) -> int:
+        walk_node_id = len(self.__parents)
 
-        if parent is not None:  # Add edge to parent if not root
-            self.__walk_tree.add_edge(u_of_edge=parent, v_of_edge=self.__last_node)
+        self.__parents.append(parent if parent is not None else -1)
+        self.__roots.append(self.__roots[parent] if parent is not None else root)
+        self.__depths.append(self.__depths[parent] + 1 if parent is not None else 0)
+        # Each transaction starts after AFTER_CREATION, even if the constructor also ends at AFTER_TX
+        self.__transactions.append(
+            (self.__transactions[parent] if parent is not None else 0) + (node_name == 'AFTER_CREATION')
+        )
+        self.__rev_cfg_nodes.append(self.__rev_cfg_node_ids[node_name])
+        self.__paths.append(CFGPath(
+            self.reversed_cfg,
+            node_name,
+            variables=self.__contract_variables,
+            parent=self.__paths[parent] if parent is not None else None,
+            incremental_solver=self.__incremental_solver,
+            track_unsat_core=self.__unsat_cores is not None or self.__infeasible_states is not None,
+            solver_tactic=self.__solver_tactic,
+            solver_timeout=self.__solver_timeout,
+            slice_constraints=self.__slice_constraints,
+        ))
 
-        return self.__last_node
+        return walk_node_id
 
     @cached_property
     def __heuristic(self) -> Callable:
@@ -190,32 +875,47 @@ class WalkTree:
         elif self.contract.insource_heuristic_annotation != (-1, None):
             heuristic = self.contract.insource_heuristic_annotation[1]
 
-        utils.log(f"Heuristic {heuristic} is selected", level='debug')
+        utils.log(f"Heuristic {heuristic} is selected", level='info')
+        metrics.set('heuristic', heuristic)
         return Heuristic.get_instance(self.reversed_cfg, name=heuristic).fitness
 
     def __get_node_on_rev_cfg(self, walk_node_id) -> str:
-        return self.__walk_tree.nodes[walk_node_id]['name_on_rev_cfg']
+        return self.__rev_cfg_node_names[self.__rev_cfg_nodes[walk_node_id]]
 
-    @property
-    def __next_best_option(self):
-        return min(
-            self.__frontiers,
-            key=lambda item: self.__heuristic(
-                self.__get_node_on_rev_cfg(item),
-                self.entry_point,
-                current_walk=self.__cfg_path_for(item),  # TODO: Better performance
-            ),
+    def __push_frontier(self, walk_node_id: int) -> None:
+        cfg_path = self.__cfg_path_for(walk_node_id)
+        fitness = self.__heuristic(
+            self.__get_node_on_rev_cfg(walk_node_id),
+            self.entry_point,
+            current_walk=cfg_path,
         )
+        heapq.heappush(self.__frontiers, (cfg_path.unknown_results, fitness, walk_node_id))
+
+    def __pop_best_option(self) -> int:
+        *_, walk_node_id = heapq.heappop(self.__frontiers)
+        return walk_node_id
+
+    def __requeue_unknown(self, walk_node_id: int) -> None:
+        """
+        Push back the frontier whose check timed out, after the others, to check it again with twice the timeout. The
+        other unknown results (e.g., of the quantifiers) are not checked again, nor the paths which already timed out
+        more than --solver-timeout-retries times, so they are dropped as unknown.
+        """
+        cfg_path = self.__cfg_path_for(walk_node_id)
+        option_name = self.__get_node_on_rev_cfg(walk_node_id)
+        if not cfg_path.timed_out or cfg_path.unknown_results > self.__solver_timeout_retries:
+            utils.log(lambda: f"option={option_name} # The check is unknown ({cfg_path.unknown_reason}), the path is "
+                              f"dropped", level='debug')
+            self.__dropped_unknowns += 1
+            return
+
+        utils.log(lambda: f"option={option_name} # The check timed out, it is checked again later", level='debug')
+        cfg_path.recheck(cfg_path.solver_timeout * 2)
+        self.__push_frontier(walk_node_id)
+        metrics.count('requeued_unknowns')
 
     def __cfg_path_for(self, walk_node_id: int) -> CFGPath:
-        return CFGPath(
-            self.reversed_cfg,
-            *[
-                self.__get_node_on_rev_cfg(__walk_node_id)
-                for __walk_node_id in nx.shortest_path(self.__walk_tree, target=walk_node_id, source=0)
-            ],
-            variables=self.__contract_variables,
-        )
+        return self.__paths[walk_node_id]
 
     @cached_property
     def __contract_variables(self):
@@ -224,7 +924,7 @@ class WalkTree:
 
         # The IR variables
         compiled_pattern = re.compile(
-            r"^(?P<variable_name>\w+)\((?P<variable_type>([\w\.]+)|(mapping\(.*\)))\)\s(=|:=|->)")
+            r"^(?P<variable_name>\w+)\((?P<variable_type>([\w\.]+(\[])*)|(mapping\(.*\)))\)\s(=|:=|->)")
         for node in self.contract.cfg.nodes:
             for expr in self.contract.cfg.nodes[node].get("irs", []):
                 # noinspection RegExpRedundantEscape
@@ -232,9 +932,9 @@ class WalkTree:
                     if matched.group("variable_name").startswith("REF_") is False:
                         variables[matched.group("variable_name")] = matched.group("variable_type")
                     elif rvalue_matched := re.match(
-                            r"\w+\(((\w+)|(mapping\(\w+\s=>\s\w+\)))\)\s?->\s?(?P<referee_name>\w+)\[(?P<index>[\w\.]+)]",
+                            r"\w+\(((\w+(\[])*)|(mapping\(.*\)))\)\s?->\s?(?P<referee_name>\w+)\[(?P<index>[\w\.]+)]",
                             expr
-                    ):  # Mapping
+                    ):  # Mapping or array, which may be a reference to an inner mapping/array
                         referee_name = rvalue_matched.group('referee_name')
                         indx = rvalue_matched.group('index')
                         try:
@@ -261,6 +961,11 @@ class WalkTree:
                         variables[matched.group('reference_name')] = (f"STRUCT_ARR[{matched.group('type')}, "
                                                                       f"{matched.group('array_name')}"
                                                                       f"[{matched.group('index')}]]")
+                    elif matched := re.match(
+                            r"(?P<reference_name>REF_\w+)\((?P<type>\w+)\)\s->\sLENGTH\s(?P<array_name>\w+)", expr
+                    ):  # REF_i -> LENGTH array, which is kept as the `length` member of the array
+                        variables[matched.group('reference_name')] = (f"REF_STRUCT[{matched.group('type')}, "
+                                                                      f"{matched.group('array_name')}.length]")
                     else:
                         pass  # TODO ??
                 elif convert_matched := re.match(r"^(?P<variable_name>\w+) = CONVERT (\d+|[\w\.]+) to address$", expr):
@@ -276,35 +981,235 @@ class WalkTree:
 
         return variables
 
-    def traverse(self) -> CFGPath | None:
-        while True:
-            option = self.__next_best_option
+    @cached_property
+    def __check_pool(self) -> ProcessPoolExecutor:
+        # Spawned, as the z3 context of this process should not be shared by the forked workers
+        return ProcessPoolExecutor(
+            max_workers=max(self.__parallel_checks, len(self.__portfolio)),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    def __loop_visits(self, node_name: str, walk_node_id: int) -> int:
+        """The number of the visits of the node on the path, since the start of its transaction"""
+        node_id = self.__rev_cfg_node_ids[node_name]
+        after_creation_id = self.__rev_cfg_node_ids.get('AFTER_CREATION')
+
+        visits = 0
+        while walk_node_id != -1 and self.__rev_cfg_nodes[walk_node_id] != after_creation_id:
+            visits += self.__rev_cfg_nodes[walk_node_id] == node_id
+            walk_node_id = self.__parents[walk_node_id]
+        return visits
+
+    def __exceeded_bound(self, node_name: str, parent: int) -> Optional[str]:
+        """:return: The name of the bound which is exceeded by adding the node to the path of `parent`, or `None`"""
+        if self.__max_transactions is not None and node_name == 'AFTER_CREATION' and \
+                self.__transactions[parent] >= self.__max_transactions:
+            return 'transactions'
+        # Backward, a loop with n iterations visits its IFLOOP node n + 1 times
+        if self.__max_loop_iterations is not None and self.reversed_cfg.nodes[node_name].get('node_type') == 'IFLOOP' \
+                and self.__loop_visits(node_name, parent) > self.__max_loop_iterations:
+            return 'loop_iterations'
+        return None
+
+    def __pruned_by(self, walk_node_id: int, peek: bool = False) -> Optional[str]:
+        """
+        :param peek: Only check the path, without logging the pruning or using the visited states (which counts a hit
+            and refreshes the state), e.g., before the frontier is popped
+        :return: The reason of pruning the path of the walk-tree node without a solver call, or `None`
+        """
+        cfg_path = self.__cfg_path_for(walk_node_id)
+        log = (lambda message: None) if peek else (lambda message: utils.log(message, level='debug'))
+        if self.__unsat_cores is not None and (core_nodes := self.__unsat_cores.find(cfg_path)) is not None:
+            log(lambda: f"{cfg_path.last_node} is pruned by the unsat core of {sorted(core_nodes)}")
+            return 'unsat_core'
+        if self.__infeasible_states is not None and self.__infeasible_states.find(cfg_path):
+            log(lambda: f"{cfg_path.last_node} is pruned by an already infeasible state")
+            return 'infeasible_state'
+        if self.__visited_states is not None and cfg_path.unknown_results == 0:  # Unless it is visited by itself
+            visited_state = self.__visited_state(walk_node_id)
+            if self.__visited_states.peek(visited_state) if peek else visited_state in self.__visited_states:
+                log(lambda: f"{cfg_path.last_node} is pruned by an already visited state")
+                return 'visited_state'
+        return None
+
+    def __visited_state(self, walk_node_id: int) -> tuple:
+        # The states of different targets are distinguished, as the walks of the reached targets are dropped
+        return self.__roots[walk_node_id], *self.__cfg_path_for(walk_node_id).state_signature
+
+    def __rebuild_incremental_solver(self) -> None:
+        """Keep only the segments of the paths to the frontiers in the shared solver"""
+        live_literals = {
+            str(literal) for *_, walk_node_id in self.__frontiers
+            for literal in self.__cfg_path_for(walk_node_id).asserted_assumptions
+        }
+        utils.log(f"The incremental solver is rebuilt with {len(live_literals)}/{len(self.__incremental_solver)} "
+                  f"segments", level='debug')
+        self.__incremental_solver.rebuild(live_literals)
+
+    def __check_in_parallel(self, results: Dict[str, CFGPath]) -> None:
+        """
+        Check the paths of the best frontiers (the next options of the serial search) in the worker processes. The
+        frontiers are not popped, so the search still expands them in the serial order, using the results if they are
+        the best options later. Hence, the walk tree and the results are the same as the serial search.
+        """
+        candidates = []
+        for *_, walk_node_id in heapq.nsmallest(self.__parallel_checks, self.__frontiers):
+            cfg_path = self.__cfg_path_for(walk_node_id)
+            if self.target_nodes[self.__roots[walk_node_id]] in results or cfg_path.is_checked:
+                continue
+            if self.__pruned_by(walk_node_id, peek=True) is None:
+                candidates.append(cfg_path)
+
+        futures = [
+            self.__check_pool.submit(check_smt2, *cfg_path.smt2_query(), self.__solver_tactic, cfg_path.solver_timeout)
+            for cfg_path in candidates
+        ]
+        for cfg_path, future in zip(candidates, futures):
+            cfg_path.remote_result = future.result()
+        metrics.count('parallel_batches')
+        metrics.count('parallel_checks', len(candidates))
+
+    def __check_by_portfolio(self, cfg_path: CFGPath) -> None:
+        """
+        Race the tactics of the portfolio on the path in the worker processes, and take the first SAT/UNSAT result.
+        The other checks are not interrupted, they run to the end or the timeout (which is required) in their workers.
+        """
+        smt2, literal_names = cfg_path.smt2_query()
+        futures = {
+            self.__check_pool.submit(check_smt2, smt2, literal_names, tactic, cfg_path.solver_timeout): tactic
+            for tactic in self.__portfolio
+        }
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                cfg_path.remote_result = future.result()
+                if cfg_path.remote_result[0] != 'unknown':
+                    for other in pending:
+                        other.cancel()
+                    metrics.count(f'portfolio_wins_{futures[future]}')
+                    return
+
+    def __log_statistics(self, results: Dict[str, CFGPath], expansions: int) -> None:
+        utils.log(f"#EXPANSIONS: {expansions}", level='info')
+        metrics.count('expansions', expansions)
+        metrics.count('walk_tree_nodes', len(self.__parents))
+        metrics.count('reached_targets', len(results))
+        if self.__unsat_cores is not None:
+            utils.log(f"#UNSAT_CORES: {len(self.__unsat_cores)}", level='info')
+            metrics.count('unsat_cores', len(self.__unsat_cores))
+        metrics.count('dropped_unknowns', self.__dropped_unknowns)
+        if self.__dropped_unknowns:
+            utils.log(f"{self.__dropped_unknowns} paths are dropped as unknown, so the search is not complete",
+                      level='warning')
+        for bound, hits in self.__bound_hits.items():
+            metrics.count(f'{bound}_bound_hits', hits)
+            if hits:
+                utils.log(f"The {bound} bound is hit {hits} times, so the search is not complete", level='warning')
+        if self.__infeasible_states is not None:
+            utils.log(f"#INFEASIBLE_STATES: {len(self.__infeasible_states)}, which pruned "
+                      f"{metrics.counters['pruned_by_infeasible_state']} paths", level='info')
+            metrics.count('infeasible_states', len(self.__infeasible_states))
+        utils.log(f"#WALK_TREE_NODES: {len(self.__parents)}", level='debug')
+        utils.log(f"#REACHED_TARGETS: {len(results)}/{len(self.target_nodes)}", level='debug')
+        utils.log(f"IR translation cache: {ir_translation_cache.stats}", level='info')
+        if self.__slice_constraints:
+            utils.log(f"Sliced constraints: {metrics.counters['sliced_constraints']}, trivial constraints: "
+                      f"{metrics.counters['trivial_constraints']}", level='info')
+        if self.__visited_states is not None:
+            utils.log(f"Visited states: {self.__visited_states.stats}", level='info')
+            metrics.count('visited_state_evictions', self.__visited_states.evictions)
+
+    def traverse(self) -> Dict[str, CFGPath | None]:
+        """
+        :return: The first SAT path from each target node to the entry point, or `None` for the unreachable targets.
+        """
+        results: Dict[str, CFGPath] = {}
+        try:
+            expansions = self.__search(results)
+        finally:
+            if '_WalkTree__check_pool' in self.__dict__:  # Only if it is created
+                self.__check_pool.shutdown(wait=False, cancel_futures=True)  # The losing checks are not waited for
+
+        self.__log_statistics(results, expansions)
+        return {target_node: results.get(target_node) for target_node in self.target_nodes}
+
+    def __search(self, results: Dict[str, CFGPath]) -> int:
+        """Expand the frontiers until all the targets are reached, and add their paths to `results`"""
+        expansions = 0
+        while self.__frontiers and len(results) < len(self.target_nodes):
+            if self.__incremental_solver is not None and self.__incremental_solver.needs_rebuild:
+                self.__rebuild_incremental_solver()
+            if self.__parallel_checks > 1 and not self.__cfg_path_for(self.__frontiers[0][-1]).is_checked:
+                self.__check_in_parallel(results)
+
+            option = self.__pop_best_option()
             option_name = self.__get_node_on_rev_cfg(option)
-            self.__frontiers.remove(option)  # TODO: Maybe better implementation; This O(n) now.
+
+            target_node = self.target_nodes[self.__roots[option]]
+            if target_node in results:  # The rest of the walks of a reached target are dropped
+                continue
 
             cfg_path = self.__cfg_path_for(option)
+            if (reason := self.__pruned_by(option)) is not None:
+                metrics.count(f'pruned_by_{reason}')
+                continue
+            if self.__visited_states is not None:
+                self.__visited_states.add(self.__visited_state(option))
+            if self.__portfolio and not cfg_path.is_checked:
+                self.__check_by_portfolio(cfg_path)
 
-            utils.log(f"Extending {option_name}", level='debug')
-            utils.log(f"The new path is {cfg_path.nodes}", level='debug')
-            for i in range(len(cfg_path.expressions)):
-                utils.log(
-                    f"option={option_name} # {cfg_path.expressions[i].ljust(50)} {cfg_path.constraints[i]}",
-                    level='debug',
-                )
-            utils.log(f"option={option_name} # Is Sat? {cfg_path.is_sat}", level='debug')
-            utils.log(f"option={option_name} # Sat inputs: {cfg_path.sat_inputs}", level='debug')
+            expansions += 1
+
+            if utils.logger.is_enabled('debug'):  # Stringifying the paths and the z3 constraints is costly
+                utils.log(f"Extending {option_name} at depth {self.__depths[option]} (target {target_node})",
+                          level='debug')
+                utils.log(f"The new path is {cfg_path.nodes}", level='debug')
+                # The expressions of the parent path are already logged on its expansion
+                for expr, constraint in zip(cfg_path.own_expressions, cfg_path.own_constraints):
+                    utils.log(f"option={option_name} # {expr.ljust(50)} {constraint}", level='debug')
+                utils.log(f"option={option_name} # Is Sat? {cfg_path.is_sat}", level='debug')
+                utils.log(f"option={option_name} # Solve time: {cfg_path.solve_time:.6f}s", level='debug')
+                utils.log(f"option={option_name} # Sat inputs: {cfg_path.sat_inputs}", level='debug')
 
-            if cfg_path.is_sat:
+            if not cfg_path.is_sat and cfg_path.is_unknown:  # Neither SAT nor UNSAT, so it is not infeasible
+                self.__requeue_unknown(option)
+            elif cfg_path.is_sat:
                 if self.__get_node_on_rev_cfg(option) == self.entry_point:
+                    if not cfg_path.is_sat_at_full_width and cfg_path.is_unknown:
+                        self.__requeue_unknown(option)
+                        continue
+                    if not cfg_path.is_sat_at_full_width:  # The abstraction is checked before reporting the path
+                        utils.log(lambda: f"option={option_name} # The path is UNSAT without the arithmetic "
+                                          f"abstraction", level='debug')
+                        metrics.count('abstraction_false_positives')
+                        continue
                     utils.log(
-                        f"option={option_name} # There is a SAT path to entry point with inputs: {cfg_path.sat_inputs}",
+                        lambda: f"option={option_name} # There is a SAT path to entry point with inputs: "
+                                f"{cfg_path.sat_inputs}",
                         level='debug',
                     )
-                    return cfg_path
+                    results[target_node] = cfg_path
                 else:  # SAT but not the full walk from target to entry point
                     for neighbor in self.reversed_cfg.neighbors(self.__get_node_on_rev_cfg(option)):
+                        if (bound := self.__exceeded_bound(neighbor, option)) is not None:
+                            utils.log(lambda: f"option={option_name} # {neighbor} exceeds the {bound} bound",
+                                      level='debug')
+                            self.__bound_hits[bound] += 1
+                            continue
                         node_id = self.__add_node(neighbor, parent=option)
-                        self.__frontiers.append(node_id)
+                        self.__push_frontier(node_id)
+            else:
+                if cfg_path.unsat_core is not None:
+                    utils.log(
+                        lambda: f"option={option_name} # Unsat core of "
+                                f"{sorted({node for node, _ in cfg_path.unsat_core})}",
+                        level='debug',
+                    )
+                    if self.__unsat_cores is not None:
+                        self.__unsat_cores.add(cfg_path.unsat_core)
+                if self.__infeasible_states is not None:
+                    self.__infeasible_states.add(cfg_path)
 
-            if self.__frontiers.__len__() == 0:
-                return None
+        return expansions
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from functools import cached_property
+from importlib import metadata
+from pathlib import Path
+from typing import Any
+
+import utils
+
+CACHE_FORMAT_VERSION = 2
+
+# Changing any of these packages may change the compiled artifacts or the constructed CFG
+TOOLS = ['py-solc-x', 'solc-select', 'slither-analyzer', 'networkx']
+
+
+class CompilationCache:
+    """
+    A content-addressed on-disk cache for the compilation artifacts of the smart contracts. Each entry is stored at
+    `<directory>/<name>/<key>`, where the key is the hash of everything the artifact is built from, so changing any
+    input makes a new entry instead of reusing a stale one.
+    """
+
+    def __init__(self, directory: str | Path, enabled: bool = True):
+        self.directory = Path(directory)
+        self.enabled = enabled
+
+    @cached_property
+    def tool_versions(self) -> dict:
+        versions = {}
+        for tool in TOOLS:
+            try:
+                versions[tool] = metadata.version(tool)
+            except metadata.PackageNotFoundError:
+                versions[tool] = None
+        return versions
+
+    def key(self, *key_parts) -> str:
+        return hashlib.sha256(
+            json.dumps([CACHE_FORMAT_VERSION, self.tool_versions, *key_parts], sort_keys=True).encode()
+        ).hexdigest()
+
+    def __path(self, name: str, key_parts: tuple) -> Path:
+        return self.directory.joinpath(name, self.key(*key_parts))
+
+    def load(self, name: str, *key_parts) -> Any | None:
+        """
+        Load the `name` artifact built from `key_parts`. Artifacts named `*.json` are stored as JSON, `*.jsonl` as text,
+        and others are pickled.
+        :return: The artifact or None if it is not cached.
+        """
+        if not self.enabled:
+            return None
+
+        path = self.__path(name, key_parts)
+        try:
+            with open(path, 'rb') as f:
+                if name.endswith('.json'):
+                    value = json.load(f)
+                elif name.endswith('.jsonl'):
+                    value = f.read().decode()
+                else:
+                    value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:  # A corrupted entry is rebuilt
+            utils.log(f"Ignoring the cached {name} at {path}: {e}", level='error')
+            return None
+
+        utils.log(f"{name} is loaded from the cache")
+        return value
+
+    def store(self, name: str, value: Any, *key_parts) -> None:
+        if not self.enabled:
+            return
+
+        path = self.__path(name, key_parts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file first, so concurrent runs never read a partially written entry
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            if name.endswith('.json'):
+                f.write(json.dumps(value).encode())
+            elif name.endswith('.jsonl'):
+                f.write(value.encode())
+            else:
+                pickle.dump(value, f)
+        os.replace(f.name, path)
+
+
+def source_hash(source: str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
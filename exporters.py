@@ -1,11 +1,14 @@
 import json
-from typing import Any, Union, List
+import threading
+import time
+from typing import Any, Callable, Union, List
 
 import networkx as nx
 
 from arg_parser import args
+from metrics import metrics
 from utils import log
-from workspace import workspace
+from workspace import current_workspace
 
 
 class Exporter:
@@ -34,20 +37,71 @@ class Exporter:
         return nx.nx_pydot.to_pydot(value_to_export)
 
 
-def export_requested_parameters(contract):
+# The exports of each --export-profile, which are stored unless their --export-* option is given
+FAST_EXPORTS = [
+    'export_loc', 'export_bin', 'export_abi', 'export_opcodes', 'export_storage_layout', 'export_metadata',
+    'export_srcmap',
+]
+EXPORT_PROFILES = {
+    'none': [],
+    'fast': FAST_EXPORTS,
+    'full': [*FAST_EXPORTS, 'export_ast', 'export_asm', 'export_opcodes_pyevmasm', 'export_cfg__dot',
+             'export_reversed_cfg__dot'],
+}
+
+
+def requested_exports() -> List[str]:
+    """The export_* options which are requested by the flags, or by the export profile for the missing flags"""
+    requested = []
+    for item in filter(lambda x: x.startswith('export_') and x != 'export_profile', args.__dict__.keys()):
+        if getattr(args, item) is None:
+            if item in EXPORT_PROFILES[args.export_profile]:
+                requested.append(item)
+        elif getattr(args, item) is True:
+            requested.append(item)
+    return requested
+
+
+def export_requested_parameters(contract, requested: List[str] = None, workspace: str = None):
     log("start exporting requested parameters...")
 
-    requested_export_list = filter(lambda x: x.startswith('export_'), args.__dict__.keys())
-    for item in requested_export_list:
-        if getattr(args, item, False) is True:
-            key_to_export = item.replace('export_', '')
-            if "__" in item:  # Means for export_key__format we should change naming format to key.format
-                key_to_export = key_to_export.split("__")[0]
-                file_to_open = f"{workspace}/{key_to_export}.{item.split('__')[1]}"
-            else:
-                file_to_open = f"{workspace}/output.{key_to_export}"
+    workspace = workspace or current_workspace()
+    for item in requested if requested is not None else requested_exports():
+        start_time = time.perf_counter()
+
+        key_to_export = item.replace('export_', '')
+        if "__" in item:  # Means for export_key__format we should change naming format to key.format
+            key_to_export = key_to_export.split("__")[0]
+            file_to_open = f"{workspace}/{key_to_export}.{item.split('__')[1]}"
+        else:
+            file_to_open = f"{workspace}/output.{key_to_export}"
 
+        try:
             value_to_export = Exporter.export(getattr(contract, key_to_export))
+        except Exception as e:  # An export should not fail the analysis, which is already done
+            log(f"Export {key_to_export} failed: {type(e).__name__}: {e}", level='error')
+            continue
+
+        with open(file_to_open, "w") as f:
+            f.write(value_to_export.__str__())
+
+        log(f"Export {key_to_export} took {time.perf_counter() - start_time:.3f}s", level='debug')
+        metrics.add_time('exports', time.perf_counter() - start_time)
+
+
+def export_in_background(contract, on_done: Callable[[], None] = None) -> threading.Thread:
+    """
+    Store the requested exports in a background thread, e.g., after the search, and call `on_done` after that. The
+    requested exports and the workspace are read before starting the thread, so a next run in the same process does
+    not change them.
+    """
+    def export(requested, workspace):
+        try:
+            export_requested_parameters(contract, requested, workspace)
+        finally:
+            if on_done is not None:
+                on_done()
 
-            with open(file_to_open, "w") as f:
-                f.write(value_to_export.__str__())
+    thread = threading.Thread(target=export, args=(requested_exports(), current_workspace()), name='exporter')
+    thread.start()
+    return thread
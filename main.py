@@ -1,23 +1,74 @@
+import sys
 from datetime import datetime
+from typing import Dict, List, Optional
 
-from exporters import export_requested_parameters
+from arg_parser import args, parse_args
+from exporters import export_in_background
+from metrics import metrics, profiler
 from sol_utils import SolFile
-from utils import log
-from workspace import workspace
+from utils import log, logger
+from workspace import prepare_workspace
+
+NO_PATH_OUTPUT = "No path found from target to smart contract entrypoint"
+
+
+def format_results(results: Dict[str, Optional[List[dict]]]) -> str:
+    """The output of a run: the transactions as before for one target, and a `<target node>: ...` line per target"""
+    if len(results) == 0:
+        return "No target found in the smart contract"
+    if len(results) == 1:
+        txs = next(iter(results.values()))
+        return str(txs) if txs is not None else NO_PATH_OUTPUT
+
+    return '\n'.join(
+        f"{target}: {txs if txs is not None else NO_PATH_OUTPUT}" for target, txs in results.items()
+    )
+
+
+def run(argv: Optional[List[str]] = None, wait_for_exports: bool = True) -> Dict[str, Optional[List[dict]]]:
+    """
+    Run the targeted backward symbolic execution on the contract of `argv` (the command line by default) in a new
+    workspace. The exports are stored in background after the search, and are not part of the execution time.
+
+    :return: The transactions which reach each target node, or `None` for the targets with no such path.
+    """
+    parse_args(argv)
+    workspace = prepare_workspace()
+    metrics.reset()
+    metrics.set('contract', args.contract)
+    metrics.set('workspace', str(workspace))
 
-if __name__ == '__main__':
     contract = SolFile(f"{workspace}/source.sol")
+    with profiler(args.profile, workspace), metrics.timer('run'):
+        metrics.set('loc', contract.loc)
+        _ = contract.reversed_cfg  # The CFG is built (or loaded) before measuring the search time
+
+        start_time = datetime.utcnow().timestamp()
+        results = {}
+        with metrics.timer('search'):
+            test_data = contract.find_test_data
+        for target, cfg_path in test_data.items():
+            results[target] = None
+            if cfg_path is not None:
+                log(lambda: f"Sat inputs of {target}: {cfg_path.sat_inputs}")
+                results[target] = cfg_path.txs
+                log(lambda: str(results[target]))
 
-    export_requested_parameters(contract)
+        exec_time = datetime.utcnow().timestamp() - start_time
 
-    start_time = datetime.utcnow().timestamp()
-    cfg_path = contract.find_test_data
-    if cfg_path is None:
-        print("No path found from target to smart contract entrypoint")
-    else:
-        log(f"Sat inputs: {cfg_path.sat_inputs}")
-        log(cfg_path.txs)
-        print(cfg_path.txs)
+    log(f"Exec Time: {exec_time:.6f}s", level="info")
+    metrics.set('exec_time', exec_time)
+    log(lambda: f"Phase times:\n{metrics.summary_table()}", level='info')
+    if args.profile != 'none':
+        print(metrics.summary_table(), file=sys.stderr)
 
-    exec_time = datetime.utcnow().timestamp() - start_time
-    log(f"Exec Time: {exec_time:.2}s", level="info")
+    # The metrics are stored after the exports, which may compile the contract
+    exporter = export_in_background(contract, on_done=lambda: metrics.dump(workspace))
+    if wait_for_exports:
+        exporter.join()
+        logger.flush()
+    return results
+
+
+if __name__ == '__main__':
+    print(format_results(run(wait_for_exports=False)))  # The exports are done before exit
@@ -0,0 +1,126 @@
+import io
+import json
+import pstats
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+METRICS_FILE = 'metrics.json'
+METRICS_FORMAT_VERSION = 1
+
+
+class Metrics:
+    """
+    The phase timers, counters, and values of a run, which are stored in the workspace as `metrics.json`. Phases which
+    run more than once (e.g., the solver) accumulate their time.
+    """
+
+    def __init__(self):
+        self.timers = defaultdict(float)
+        self.calls = defaultdict(int)  # The number of measurements of each timer
+        self.counters = defaultdict(int)
+        self.values = {}
+
+    def reset(self) -> None:
+        self.timers.clear()
+        self.calls.clear()
+        self.counters.clear()
+        self.values.clear()
+
+    @contextmanager
+    def timer(self, name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timers[name] += seconds
+        self.calls[name] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def set(self, name: str, value) -> None:
+        self.values[name] = value
+
+    @staticmethod
+    def peak_memory_mb() -> float:
+        """The peak resident memory of the process, so for the warm workers of batch mode it covers the earlier jobs"""
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024  # bytes on macOS, KiB on Linux
+
+    @property
+    def record(self) -> dict:
+        return {
+            'version': METRICS_FORMAT_VERSION,
+            **self.values,
+            'times': dict(self.timers),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters),
+            'peak_memory_mb': self.peak_memory_mb(),
+        }
+
+    def summary_table(self, total: str = 'run') -> str:
+        """The timers as a table, sorted by their time, with their share of the `total` timer"""
+        total_time = self.timers.get(total) or sum(self.timers.values()) or 1
+        lines = [f"{'phase':<24}{'calls':>10}{'total (s)':>14}{'mean (ms)':>14}{'share':>9}"]
+        for name, seconds in sorted(self.timers.items(), key=lambda item: -item[1]):
+            lines.append(
+                f"{name:<24}{self.calls[name]:>10}{seconds:>14.6f}{seconds * 1000 / self.calls[name]:>14.3f}"
+                f"{seconds / total_time:>9.1%}"
+            )
+        lines.extend(f"{name:<24}{count:>10}" for name, count in self.counters.items())
+        return '\n'.join(lines)
+
+    def dump(self, workspace) -> None:
+        with open(f"{workspace}/{METRICS_FILE}", "w") as f:
+            json.dump(self.record, f, indent=2, default=str)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def profiler(kind: str, workspace):
+    """
+    Profile the block with cProfile or pyinstrument (if installed), and store the profile in the workspace:
+    `profile.prof` (for pstats/snakeviz) and `profile.txt` for cProfile, or `profile.html` and `profile.txt` for
+    pyinstrument. Other kinds do not profile.
+    """
+    if kind == 'cprofile':
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(f"{workspace}/profile.prof")
+            with open(f"{workspace}/profile.txt", "w") as f:
+                stream = io.StringIO()
+                pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(50)
+                f.write(stream.getvalue())
+    elif kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("pyinstrument is not installed, use `pip install pyinstrument` or --profile cprofile") \
+                from None
+
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(f"{workspace}/profile.html", "w") as f:
+                f.write(profile.output_html())
+            with open(f"{workspace}/profile.txt", "w") as f:
+                f.write(profile.output_text())
+    else:
+        yield
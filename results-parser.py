@@ -1,38 +1,84 @@
+import argparse
+import csv
+import json
 import os
+import statistics
+import sys
+from collections import defaultdict
+from typing import Iterator, List
+
+from metrics import METRICS_FILE
+
+COLUMNS = [
+    ("Date", lambda m: os.path.basename(m['workspace'])),
+    ("Smart Contract", lambda m: f"{os.path.basename(m['contract'])} [{m.get('contract_name')}]"),
+    ("#LoC", lambda m: m.get('loc')),
+    ("# Generated Walks", lambda m: m['counters'].get('expansions', 0)),
+    ("# CFG Nodes", lambda m: m.get('cfg_nodes')),
+    ("Execution Time (s)", lambda m: m.get('exec_time')),
+    ("Heuristic", lambda m: m.get('heuristic')),
+    ("# Targets", lambda m: len(m.get('targets', []))),
+    ("# Reached Targets", lambda m: m['counters'].get('reached_targets', 0)),
+    ("# SAT", lambda m: m['counters'].get('sat', 0)),
+    ("# UNSAT", lambda m: m['counters'].get('unsat', 0)),
+    ("Solver Time (s)", lambda m: m['times'].get('solver', 0)),
+    ("Compile Time (s)", lambda m: m['times'].get('compile', 0)),
+    ("Slither Time (s)", lambda m: m['times'].get('slither', 0)),
+    ("CFG Build Time (s)", lambda m: m['times'].get('cfg_build', 0)),
+    ("Heuristic Precompute Time (s)", lambda m: m['times'].get('heuristic_precompute', 0)),
+    ("Peak Memory (MB)", lambda m: m.get('peak_memory_mb')),
+]
+
+
+def read_metrics(directories: List[str]) -> Iterator[dict]:
+    """Yield the metrics records of the runs in the given output directories"""
+    for directory in directories:
+        for workspace in sorted(os.listdir(directory)):
+            try:
+                with open(os.path.join(directory, workspace, METRICS_FILE)) as f:
+                    yield json.load(f)
+            except (FileNotFoundError, NotADirectoryError):
+                continue  # Not a workspace, or the run is not finished
+
+
+def summarize(records: List[dict]) -> List[list]:
+    """The number of runs and the median times of each (contract, heuristic)"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[(record['contract'], record.get('heuristic'))].append(record)
+
+    rows = []
+    for (contract, heuristic), group in sorted(groups.items(), key=lambda item: tuple(map(str, item[0]))):
+        rows.append([
+            contract, heuristic, len(group),
+            statistics.median(record['exec_time'] for record in group),
+            statistics.median(record['times'].get('solver', 0) for record in group),
+            statistics.median(record['counters'].get('expansions', 0) for record in group),
+            max(record['peak_memory_mb'] for record in group),
+        ])
+    return rows
+
 
 if __name__ == '__main__':
-    print(', '.join(
-        ["Date", "Smart Contract", "#LoC", "# Generated Walks", "# CFG Nodes", "Execution Time (s)", "Heuristic"]
-    ))
-
-    for output in os.listdir('output/'):
-        try:
-            with open(os.path.join('output/', output, 'output.loc')) as f:
-                loc = f.readline()
-        except FileNotFoundError:
-            continue
-
-        with open(os.path.join('output/', output, 'out.log')) as f:
-            num_walks = 0
-            num_of_cfg_nodes = -1
-            exec_time = None
-            contract_name = None
-            heuristic = None
-
-            for line in f.readlines():
-                if 'new path' in line:
-                    num_walks += 1
-
-                if line.startswith("[info] Contract Name: "):
-                    contract_name = line.removeprefix("[info] Contract Name: ").removesuffix("\n")
-                if line.startswith("[debug] #NUM_OF_CFG_NODES: "):
-                    num_of_cfg_nodes = line.removeprefix("[debug] #NUM_OF_CFG_NODES: ").removesuffix("\n")
-                if line.startswith("[info] Exec Time: "):
-                    exec_time = str(float(line.removeprefix("[info] Exec Time: ").removesuffix('s\n')))
-                if line.startswith("[debug] Heuristic "):
-                    heuristic = line.removeprefix("[debug] Heuristic ").removesuffix('\n')
-
-            if exec_time is None:
-                continue
-
-        print(', '.join([output, contract_name, loc, str(num_walks), num_of_cfg_nodes, exec_time, heuristic]))
+    parser = argparse.ArgumentParser(description="Aggregate the metrics of the runs in the output directories")
+    parser.add_argument('directories', nargs='*', default=['output/'],
+                        help="The output directories which contain the workspaces of the runs.")
+    parser.add_argument('--summary', action='store_true', default=False,
+                        help="Print the medians of each contract and heuristic instead of a row per run.")
+    parser.add_argument('--jsonl', action='store_true', default=False,
+                        help="Print the metrics records as JSON lines instead of CSV.")
+    parser_args = parser.parse_args()
+
+    writer = csv.writer(sys.stdout)
+    if parser_args.jsonl:
+        for metrics_record in read_metrics(parser_args.directories):
+            print(json.dumps(metrics_record))
+    elif parser_args.summary:
+        writer.writerow(["Smart Contract", "Heuristic", "# Runs", "Median Execution Time (s)",
+                         "Median Solver Time (s)", "Median # Generated Walks", "Max Peak Memory (MB)"])
+        writer.writerows(summarize([record for record in read_metrics(parser_args.directories)
+                                    if record.get('exec_time') is not None]))
+    else:
+        writer.writerow([name for name, _ in COLUMNS])
+        for metrics_record in read_metrics(parser_args.directories):
+            writer.writerow([value(metrics_record) for _, value in COLUMNS])
@@ -1,15 +1,21 @@
 import logging
+import os
 import re
+import sys
 import time
-from functools import cached_property, partial
-from typing import List
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import cached_property, partial, lru_cache, reduce
+from typing import List, Tuple
 
 import ply.lex as lex
 import ply.yacc as yacc
-from manticore.ethereum.abitypes import lexer as type_lexer
-from manticore.exceptions import EthereumError
 from z3 import BitVecVal, BoolVal, Bool, And, Or, Not, Function, IntSort, BoolSort, Int, ForAll, \
-    Implies, BitVec, ULT, UGT, ULE, UGE, UDiv, URem, BitVecSort, String
+    Implies, BitVec, ULT, UGT, ULE, UGE, UDiv, URem, BitVecSort, String, IntVal, Const, ExprRef, \
+    Z3_OP_UNINTERPRETED, Z3_ARRAY_SORT, is_const, is_quantifier, substitute, Select, Store, K, ArraySort, Extract, \
+    ZeroExt, is_bv, is_int
+
+from metrics import metrics
 
 logger = logging.getLogger('SlitherIRPLY')
 
@@ -26,6 +32,7 @@ reserved = {
     'TRANSACTION_STARTS': 'TRANSACTION_STARTS',
 
     'NOT': 'NOT',
+    'LENGTH': 'LENGTH',
 
     'this': 'THIS',
 }
@@ -75,6 +82,44 @@ tokens = [
 tokens.extend(list(reserved.values()))  # Add reserved keywords to tokens
 
 
+# The ABI type tokens of the manticore type lexer, in its matching order. As in that lexer, the first pattern matching
+# a prefix of the identifier wins, e.g., `addressBook` is an ADDRESS and `interest` is an INT.
+# https://github.com/trailofbits/manticore/blob/master/manticore/ethereum/abitypes.py
+_M_SIZES = '|'.join(str(n) for n in range(256, 0, -8))
+_N_DECIMALS = '|'.join(str(n) for n in range(80, 0, -1))
+_BYTES_SIZES = '|'.join(str(n) for n in range(32, 0, -1))
+TYPE_TOKENS = [  # (token type, pattern, value builder)
+    ('UINTN', rf'uint(?P<UINTN_size>{_M_SIZES})', lambda m: ('uint', int(m.group('UINTN_size')))),
+    ('ADDRESS', r'address', lambda m: ('uint', 160)),
+    ('BOOL', r'bool', lambda m: ('uint', 8)),
+    ('UINT', r'uint', lambda m: ('uint', 256)),
+    ('INTN', rf'int(?P<INTN_size>{_M_SIZES})', lambda m: ('int', int(m.group('INTN_size')))),
+    ('INT', r'int', lambda m: ('int', 256)),
+    ('FIXEDMN', rf'^fixed(?P<FIXEDMN_M>{_M_SIZES})x(?P<FIXEDMN_N>{_N_DECIMALS})',
+     lambda m: ('fixed', int(m.group('FIXEDMN_M')), int(m.group('FIXEDMN_N')))),
+    ('FIXED', r'fixed', lambda m: ('fixed', 128, 18)),
+    ('UFIXEDMN', rf'ufixed(?P<UFIXEDMN_M>{_M_SIZES})x(?P<UFIXEDMN_N>{_N_DECIMALS})',
+     lambda m: ('ufixed', int(m.group('UFIXEDMN_M')), int(m.group('UFIXEDMN_N')))),
+    ('UFIXED', r'ufixed', lambda m: ('ufixed', 128, 18)),
+    ('BYTESM', rf'bytes(?P<BYTESM_size>{_BYTES_SIZES})', lambda m: ('bytesM', int(m.group('BYTESM_size')))),
+    ('BYTES', r'bytes', lambda m: ('bytes',)),
+    ('STRING', r'string', lambda m: ('string',)),
+    ('FUNCTION', r'function', lambda m: ('function',)),
+]
+TYPE_TOKEN_REGEX = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern, _ in TYPE_TOKENS))
+TYPE_TOKEN_VALUES = {name: value for name, _, value in TYPE_TOKENS}
+
+
+@lru_cache(maxsize=4096)
+def type_token(identifier: str):
+    """
+    :return: (token type, value) Tuple of the ABI type which the identifier starts with, or `None` if it is not a type.
+    """
+    if (matched := TYPE_TOKEN_REGEX.match(identifier)) is None:
+        return None
+    return matched.lastgroup, TYPE_TOKEN_VALUES[matched.lastgroup](matched)
+
+
 # Variables
 # https://github.com/crytic/slither/wiki/SlithIR#variables
 # noinspection PyPep8Naming
@@ -82,16 +127,9 @@ def t_ID(t):
     r"""[a-zA-Z_][a-zA-Z_0-9]*"""
     t.type = reserved.get(t.value, 'ID')  # Check for reserved words
 
-    # Check for type tokens using manticore lexer
-    # https://github.com/trailofbits/manticore/blob/master/manticore/ethereum/abitypes.py
-    try:
-        type_lexer.input(t.value)
-        type_token = type_lexer.token()
-        if type_token:
-            t.type = type_token.type
-            t.value = type_token.value
-    except EthereumError:  # Do nothing if this is not a type token
-        pass
+    # Check for type tokens, the same as the manticore type lexer
+    if (matched_type := type_token(t.value)) is not None:
+        t.type, t.value = matched_type
     if t.value == 'None':
         t.type = "VOID"
     if t.value == 'string':
@@ -148,12 +186,41 @@ def t_error(t):
     pass  # TODO: Should implement later.
 
 
-IR_LEXER = lex.lex()  # TODO Add more lex patterns
+@lru_cache(maxsize=None)
+def ir_lexer() -> lex.Lexer:
+    """The lexer is built on its first use instead of on import"""
+    return lex.lex(module=sys.modules[__name__])  # TODO Add more lex patterns
+
+
+class SSASlot:
+    """
+    The placeholder of an SSA index while an IR expression is translated to a template. `access` is the index of the
+    symbol table access which the SSA index comes from.
+    """
+    MARKER = '$ssa'
+    NAME_PATTERN = re.compile(r'^(?P<prefix>.*)\$ssa(?P<access>\d+)(\+(?P<offset>\d+))?$')
+
+    def __init__(self, access: int, offset: int = 0):
+        self.access = access
+        self.offset = offset
+
+    def __add__(self, other: int):
+        return SSASlot(self.access, self.offset + other)
+
+    def __str__(self):
+        return f"{self.MARKER}{self.access}{f'+{self.offset}' if self.offset else ''}"
+
+
+REFERENCE_TYPE_PATTERN = re.compile(r'^REF\[(?P<referee_type>.+),\s(?P<referee>\w+),\s(?P<index>[\w.]+)]$')
+MAPPING_TYPE_PATTERN = re.compile(r'^mapping\((?P<key>\w+)\s?=>\s?(?P<value>.+)\)$')
 
 
 class SymbolTableManager:
     __instance = None
 
+    MAPPING_ENCODINGS = ['function', 'array']
+    ARITHMETIC_ABSTRACTIONS = ['none', 'narrow', 'int']
+
     def __init__(self):
         if self.__instance is not None:
             raise NotImplementedError
@@ -161,6 +228,95 @@ class SymbolTableManager:
         self.__symbols = {}
         self.__types = {}
 
+        # `function`: each mapping is an uninterpreted function of the key and the SSA index, and each write keeps the
+        # other keys by a `ForAll`. `array`: each SSA version of a mapping is a z3 array, and each write is a `Store`,
+        # so the constraints are quantifier-free.
+        self.mapping_encoding = 'function'
+
+        # `none`: the declared widths, and the addresses are 256-bit words. `narrow`: the addresses are 160 bits.
+        # `int`: the integers and the addresses are unbounded `Int`s, with the range of each assigned variable.
+        self.arithmetic_abstraction = 'none'
+
+        self.__recorded_accesses = None  # The accesses to the SSA indices while recording a template
+
+        self.__types_source = None
+        self.types_version = 0  # Changes whenever different types are set, so the cached translations are invalid
+
+    @contextmanager
+    def recording(self):
+        """
+        Record the accesses to the SSA indices instead of applying them. The indices are replaced with `SSASlot`s,
+        so the translated expression can be instantiated later for any state of the symbol table.
+        """
+        self.__recorded_accesses = []
+        try:
+            yield self.__recorded_accesses
+        finally:
+            self.__recorded_accesses = None
+
+    def get_ssa_index(self, symbol_name, plus_plus=False, save=False) -> int | SSASlot:
+        if self.__recorded_accesses is not None:
+            self.__recorded_accesses.append((symbol_name, plus_plus, save))
+            return SSASlot(len(self.__recorded_accesses) - 1)
+
+        if plus_plus:
+            if save is False:
+                return self.__symbols.get(symbol_name, -1) + 1
+            else:
+                self.__symbols[symbol_name] = self.__symbols.get(symbol_name, -1) + 1
+                return self.__symbols[symbol_name]
+
+        return self.__symbols.get(symbol_name, 0)
+
+    @staticmethod
+    def __ssa_index_value(index: int | SSASlot):
+        return index if isinstance(index, int) else Int(str(index))
+
+    @staticmethod
+    def __z3_array(func, index: int | SSASlot):
+        """
+        The SSA version of the mapping/array (given as its `function` encoding) as a z3 array, which is nested for the
+        multi-dimensional ones, e.g., `mapping(address => mapping(address => bool))`
+        """
+        sort = func.range()
+        for dimension in reversed(range(func.arity() - 1)):  # The last argument is the SSA index
+            sort = ArraySort(func.domain(dimension), sort)
+        return Const(f"{func.name()}_{index}", sort)
+
+    @classmethod
+    def __z3_store(cls, array, keys: list, value):
+        """Store the value in the nested arrays, only the arrays on the path of the keys are changed"""
+        if len(keys) == 1:
+            return Store(array, keys[0], value)
+        return Store(array, keys[0], cls.__z3_store(Select(array, keys[0]), keys[1:], value))
+
+    @staticmethod
+    def __z3_zero(sort):
+        if sort.kind() == Z3_ARRAY_SORT:
+            return K(sort.domain(), SymbolTableManager.__z3_zero(sort.range()))
+        return BoolVal(False) if sort == BoolSort() else sort.cast(0)
+
+    def set_mapping_encoding(self, encoding: str) -> None:
+        if encoding not in self.MAPPING_ENCODINGS:
+            raise ValueError(f"Unknown mapping encoding {encoding}")
+        if encoding != self.mapping_encoding:
+            self.types_version += 1  # The cached translations are of the other encoding
+        self.mapping_encoding = encoding
+
+    def set_arithmetic_abstraction(self, abstraction: str) -> None:
+        if abstraction not in self.ARITHMETIC_ABSTRACTIONS:
+            raise ValueError(f"Unknown arithmetic abstraction {abstraction}")
+        self.arithmetic_abstraction = abstraction  # The translation cache is keyed by the abstraction
+
+    @contextmanager
+    def abstraction(self, abstraction: str):
+        """Translate with the given arithmetic abstraction, e.g., `none` for checking a path at the full width"""
+        previous_abstraction, self.arithmetic_abstraction = self.arithmetic_abstraction, abstraction
+        try:
+            yield
+        finally:
+            self.arithmetic_abstraction = previous_abstraction
+
     @classmethod
     def get_instance(cls):
         if cls.__instance is None:
@@ -170,32 +326,87 @@ class SymbolTableManager:
 
     def get_variable(self, symbol_name, plus_plus=False, save=False) -> str:
         # TODO: Change name of this function to get indexed variable
-        if plus_plus:
-            if save is False:
-                return f"{symbol_name}_{self.__symbols.get(symbol_name, -1) + 1}"
-            else:
-                self.__symbols[symbol_name] = self.__symbols.get(symbol_name, -1) + 1
-                return f"{symbol_name}_{self.__symbols[symbol_name]}"
-
-        return f"{symbol_name}_{self.__symbols.get(symbol_name, 0)}"
+        return f"{symbol_name}_{self.get_ssa_index(symbol_name, plus_plus=plus_plus, save=save)}"
 
     @property
     def get_mapping_references(self):
         return [k for k, v in self.__types.items() if ('mapping' in v and k.startswith('REF_'))]
 
-    @classmethod
-    def __z3_sorts(cls, variable_type):
+    @property
+    def get_container_references(self):
+        """The references to the elements of the mappings and the arrays"""
+        return [k for k, v in self.__types.items() if k.startswith('REF_') and v.startswith('REF[')]
+
+    @property
+    def get_length_references(self):
+        return [k for k, v in self.__types.items() if k.startswith('REF_') and v.startswith('REF_STRUCT[') and
+                v.endswith('.length]')]
+
+    def reference_chain(self, symbol_name) -> Tuple[str, List[str]]:
+        """
+        :return: The mapping/array and the indices of the reference, which are more than one for the references to
+        the other references, e.g., `REF_1 -> REF_0[spender]` after `REF_0 -> allowance[owner]`
+        """
+        matched = REFERENCE_TYPE_PATTERN.match(self.__types[symbol_name])
+        referee, index = matched.group('referee'), matched.group('index')
+        if referee.startswith('REF_') and self.__types.get(referee, '').startswith('REF['):
+            base, indices = self.reference_chain(referee)
+            return base, [*indices, index]
+        return referee, [index]
+
+    def is_dynamic_array(self, symbol_name) -> bool:
+        return self.__types.get(symbol_name, '').endswith('[]')
+
+    def container_sorts(self, variable_type) -> tuple:
+        """
+        :return: (key sorts, value sort) Tuple of a (nested) mapping or dynamic array type, with a key sort for each
+        dimension, e.g., `mapping(address => uint256[])` has an address and a uint256 key.
+        """
+        key_sorts = []
+        while True:
+            if matched := MAPPING_TYPE_PATTERN.match(variable_type):
+                key_sorts.append(self.__z3_sorts(matched.group('key')))
+                variable_type = matched.group('value')
+            elif variable_type.endswith('[]'):
+                key_sorts.append(self.__z3_sorts('uint256'))
+                variable_type = variable_type[:-2]
+            else:
+                return key_sorts, self.__z3_sorts(variable_type)
+
+    @property
+    def address_sort(self):
+        return {
+            'none': BitVecSort(sz=256),
+            'narrow': BitVecSort(sz=160),
+            'int': IntSort(),
+        }[self.arithmetic_abstraction]
+
+    def __z3_sorts(self, variable_type):
         if "int" in variable_type:
+            if self.arithmetic_abstraction == 'int':
+                return IntSort()
             return BitVecSort(sz=int(variable_type.replace("uint", "").replace("int", "")))
         else:
             return {
                 'bool': BoolSort(),
-                'address': BitVecSort(sz=256),  # TODO Even better sort
+                'address': self.address_sort,
             }.get(variable_type)
 
-    @classmethod
-    def z3_types(cls, variable_type):
+    @staticmethod
+    def __int_range(variable_type) -> Tuple[int, int] | None:
+        """The [lower, upper) range of the values of the integer/address type"""
         if variable_type.startswith("uint"):
+            return 0, 2 ** int(variable_type.replace("uint", "") or 256)
+        elif variable_type.startswith("int"):
+            size = int(variable_type.replace("int", "") or 256)
+            return -2 ** (size - 1), 2 ** (size - 1)
+        elif variable_type == 'address':
+            return 0, 2 ** 160
+
+    def z3_types(self, variable_type):
+        if variable_type.startswith(("uint", "int")) and self.arithmetic_abstraction == 'int':
+            return Int
+        elif variable_type.startswith("uint"):
             return partial(BitVec, bv=int(variable_type.replace("uint", "")))
         elif variable_type.startswith("int"):
             return partial(BitVec, bv=int(variable_type.replace("int", "")))
@@ -208,52 +419,50 @@ class SymbolTableManager:
         else:
             return {
                 'bool': Bool,
-                'address': partial(BitVec, bv=256),
+                'address': partial(Const, sort=self.address_sort),
             }.get(variable_type)
 
-    @classmethod
-    def get_z3_references(cls, variable_type):
-        if 'mapping' in variable_type:
-            matched = re.match(
-                r"REF\[mapping\((?P<mapping_from>\w+)\s?=>\s?"
-                r"(?P<mapping_to>\w+)\),\s(?P<referee>\w+),\s(?P<index>[\w\.]+)]",
-                variable_type
-            )
-            if matched is None:
-                pass  # TODO: e.g., 'REF[mapping(address => mapping(address => bool)), arr, index]'
-            else:
-                return (
-                    Function(
-                        matched.group("referee"),
-                        cls.__z3_sorts(matched.group("mapping_from")),
-                        IntSort(),  # CAUTION: For the SSA
-                        cls.__z3_sorts(matched.group("mapping_to"))
-                    ),
-                    matched.group("index")
-                )
-        elif 'address[]' in variable_type:  # TODO: Generalize to any array
-            matched = re.match('REF\[address\[],\s(?P<array>\w+),\s(?P<index>[\w.]+)]', variable_type)
-            return Function(
-                matched.group('array'),
-                cls.__z3_sorts('uint256'),  # Index
-                IntSort(),  # CAUTION: For the SSA
-                cls.__z3_sorts('address'),
-            ), matched.group('index')
-        else:
-            pass  # TODO: e.g. we do not support 2d mapping now
+    def with_range_guard(self, symbol_name, variable, constraint):
+        """
+        The constraint of the assignment to the variable, with the range of its type in the `int` abstraction, i.e.,
+        the overflow guard which the bit-vectors have by their width
+        """
+        if self.arithmetic_abstraction != 'int' or not is_int(variable):
+            return constraint
+
+        variable_type = self.__types.get(symbol_name, '')
+        if variable_type.startswith('REF['):  # The type of the elements of the mapping/array
+            variable_type = self.__types[self.reference_chain(symbol_name)[0]]
+            while matched := MAPPING_TYPE_PATTERN.match(variable_type):
+                variable_type = matched.group('value')
+            variable_type = variable_type.replace('[]', '')
+        if (bounds := self.__int_range(variable_type)) is None:
+            return constraint
+        return And(constraint, variable >= bounds[0], variable < bounds[1])
+
+    def get_z3_references(self, symbol_name):
+        """
+        :return: (function, keys) Tuple of the reference. The function is the mapping/array as an uninterpreted
+        function of the keys of all the dimensions and the SSA index, and the keys are the z3 values of the indices.
+        """
+        base, indices = self.reference_chain(symbol_name)
+        key_sorts, value_sort = self.container_sorts(self.__types[base])
+        keys = [
+            key_sort.cast(int(indx)) if indx.isnumeric() else self.get_z3_variable(indx, plus_plus=False, save=False)
+            for key_sort, indx in zip(key_sorts, indices)
+        ]
+        return Function(base, *key_sorts, IntSort(), value_sort), keys
 
     def get_z3_variable(self, symbol_name, plus_plus=False, save=False):
         if symbol_name.startswith("REF_"):  # References
             _type = self.__types[symbol_name]
             if _type.startswith("REF["):
-                func, indx = self.get_z3_references(_type)
-                index_of_reference = self.get_variable(
-                    func.name(), plus_plus=plus_plus, save=save
-                ).removeprefix(func.name()).replace("_", "")
-                if indx.isnumeric() is True:
-                    return func(indx, index_of_reference)
-                else:
-                    return func(self.get_z3_variable(indx, plus_plus=False, save=False), index_of_reference)
+                func, keys = self.get_z3_references(symbol_name)
+                index_of_reference = self.get_ssa_index(func.name(), plus_plus=plus_plus, save=save)
+
+                if self.mapping_encoding == 'array':
+                    return reduce(Select, keys, self.__z3_array(func, index_of_reference))
+                return func(*keys, self.__ssa_index_value(index_of_reference))
             elif _type.startswith("REF_STRUCT["):
                 ref_type, referee = _type[11:-1].split(', ')
                 return self.z3_types(ref_type)(
@@ -278,44 +487,45 @@ class SymbolTableManager:
         if not symbol_name.startswith('REF_'):
             raise NotImplementedError
 
-        func, indx = self.get_z3_references(self.__types[symbol_name])
-        from_sort = func.domain(0)
-        if from_sort.name().lower() == "bv":
-            temp_variable = self.z3_types(f"{from_sort.name().lower()}{from_sort.size()}")(
-                f"mapping_temp_{time.time_ns()}"
-            )
-        else:
-            temp_variable = self.z3_types(from_sort.name().lower())(f"mapping_temp_{time.time_ns()}")
-
-        index_of_reference = self.get_variable(
-            func.name(), plus_plus=plus_plus, save=save
-        ).removeprefix(func.name()).replace("_", "")
-
-        # return func(temp_variable, index_of_reference) == func(temp_variable, str(int(index_of_reference) + 1))
-        if indx.isnumeric():
-            return ForAll(
-                [temp_variable],
-                Implies(
-                    temp_variable != indx,
-                    func(temp_variable, index_of_reference) == func(temp_variable, str(int(index_of_reference) + 1))
-                )
+        func, keys = self.get_z3_references(symbol_name)
+        index_of_reference = self.get_ssa_index(func.name(), plus_plus=plus_plus, save=save)
+
+        if self.mapping_encoding == 'array':  # The new version is the previous one with the written element
+            current_version = self.__z3_array(func, index_of_reference)
+            return current_version == self.__z3_store(
+                self.__z3_array(func, index_of_reference + 1), keys, reduce(Select, keys, current_version)
             )
-        else:
-            return ForAll(
-                [temp_variable],
-                Implies(
-                    temp_variable != self.get_z3_variable(indx, plus_plus=False, save=False),
-                    func(temp_variable, index_of_reference) == func(temp_variable, str(int(index_of_reference) + 1))
-                )
+
+        temp_variables = [  # A temporary variable for each dimension
+            Const(f"mapping_temp_{time.time_ns()}{f'_{dimension}' if dimension else ''}", func.domain(dimension))
+            for dimension in range(len(keys))
+        ]
+        other_keys = [temp_variable != key for temp_variable, key in zip(temp_variables, keys)]
+        next_index_of_reference = self.__ssa_index_value(index_of_reference + 1)
+        index_of_reference = self.__ssa_index_value(index_of_reference)
+
+        return ForAll(
+            temp_variables,
+            Implies(
+                other_keys[0] if len(other_keys) == 1 else Or(*other_keys),
+                func(*temp_variables, index_of_reference) == func(*temp_variables, next_index_of_reference)
             )
+        )
 
     def set_types(self, types):
+        if types is not self.__types_source and types != self.__types_source:
+            self.types_version += 1
+        self.__types_source = types
+
         self.__types = {
             **types,
             'msg.sender': 'address',
             'msg.value': 'uint256'
         }
 
+    def set_symbols(self, symbols):
+        self.__symbols = symbols.copy()
+
     def clear_table(self):
         self.__symbols = {}
         self.__types = {}
@@ -324,7 +534,40 @@ class SymbolTableManager:
     def symbols(self):
         return self.__symbols
 
-    @cached_property
+    def initial_mappings(self):
+        """
+        The constraints of the mappings and the arrays before the constructor, i.e., all the elements and the lengths
+        are zero
+        """
+        lengths = {  # The lengths of each array, even if it is referenced more than once
+            self.__types[reference_name][11:-1].split(', ')[1]: reference_name
+            for reference_name in self.get_length_references
+        }
+        constraints = BoolVal(True)
+
+        if self.mapping_encoding == 'array':
+            containers = {}
+            for reference_name in self.get_container_references:
+                func, _ = self.get_z3_references(reference_name)
+                containers[func.name()] = self.__z3_array(
+                    func, self.get_ssa_index(func.name(), plus_plus=True, save=False)
+                )
+            constraints = And(constraints, *[
+                container == self.__z3_zero(container.sort()) for container in containers.values()
+            ])
+        else:
+            for reference_name in self.get_mapping_references:
+                func, keys = self.get_z3_references(reference_name)
+                if len(keys) == func.arity() - 1:  # Not the references to the inner mappings
+                    constraints = And(
+                        constraints, self.get_z3_variable(reference_name, plus_plus=True, save=False) == 0
+                    )
+
+        for reference_name in lengths.values():
+            constraints = And(constraints, self.get_z3_variable(reference_name, plus_plus=True, save=False) == 0)
+        return constraints
+
+    @property
     def balances_storage(self):
         return Function(
             '__balances',
@@ -332,6 +575,11 @@ class SymbolTableManager:
             self.__z3_sorts('uint256'),
         )
 
+    def balance_of(self, address):
+        if self.mapping_encoding == 'array':  # The balances are never written, so a constant array is enough
+            return Select(K(self.address_sort, self.__z3_sorts('uint256').cast(0)), address)
+        return self.balances_storage(address)
+
 
 symbol_table_manager = SymbolTableManager.get_instance()
 
@@ -367,11 +615,19 @@ def p_type(p: yacc.YaccProduction):
             | VOID
             | STRING
             | ADDRESS
-            | ID DOT ID"""
+            | ID DOT ID
+            | type LBRACKETS RBRACKETS
+            | ID LPAREN type EQUAL COND_INEQUALITY type RPAREN"""
     if len(p) == 2:
         p[0] = p[1]
-    else:  # ID DOT ID
+    elif len(p) == 4 and p[2] == '[':  # Dynamic arrays
+        p[0] = ('array', p[1])
+    elif len(p) == 4:  # ID DOT ID
         p[0] = ''.join(p[1:])
+    elif p[1] == 'mapping' and p[5] == '>':  # mapping(key => value), the `=>` is lexed as `=` and `>`
+        p[0] = ('mapping', p[3], p[6])
+    else:
+        raise SlitherIRSyntaxError(p.slice[1] if p[1] != 'mapping' else p.slice[5])
 
 
 def p_return_stmt(p):
@@ -392,13 +648,13 @@ def p_assignment(p):
     if p[3] != p[8] and type(p[6][1]) != int:
         raise SlitherIRSyntaxError(p)
 
+    lvalue = symbol_table_manager.get_z3_variable(p[1], plus_plus=True, save=True)
     if p[6][0] != 'const':  # It's a variable/reference
-        p[0] = symbol_table_manager.get_z3_variable(p[1], plus_plus=True, save=True)
         _p6 = symbol_table_manager.get_z3_variable(p[6][1], plus_plus=True)
-        p[0] = p[0] == _p6
+        p[0] = lvalue == _p6
     else:
-        p[0] = symbol_table_manager.get_z3_variable(p[1], plus_plus=True, save=True)
-        p[0] = p[0] == p[6][1]
+        p[0] = lvalue == p[6][1]
+    p[0] = symbol_table_manager.with_range_guard(p[1], lvalue, p[0])
 
 
 def p_binary_operator(p):
@@ -443,7 +699,7 @@ def _rvalue_processor(rvalue):
 def p_binary_operation(p):
     """expression : ID LPAREN type RPAREN EQUAL bin_op_rvalue bin_op bin_op_rvalue"""
     #      0        1    2     3      4     5         6         7          8
-    if p[3][0].startswith("uint"):
+    if p[3][0].startswith("uint") and symbol_table_manager.arithmetic_abstraction != 'int':
         funcs = {
             '<': ULT,
             '>': UGT,
@@ -476,11 +732,12 @@ def p_binary_operation(p):
     })
     operation = funcs.get(p[7])
 
-    p[0] = symbol_table_manager.get_z3_variable(p[1], plus_plus=True, save=True)
-    p[0] = p[0] == operation(
+    lvalue = symbol_table_manager.get_z3_variable(p[1], plus_plus=True, save=True)
+    p[0] = lvalue == operation(
         _rvalue_processor(rvalue=p[6]),
         _rvalue_processor(rvalue=p[8]),
     )
+    p[0] = symbol_table_manager.with_range_guard(p[1], lvalue, p[0])
 
 
 def p_unary_operation(p):
@@ -514,6 +771,11 @@ def p_index(p):
     p[0] = BoolVal(True)  # Parsed before in variables finding
 
 
+def p_length(p):
+    """expression : ID LPAREN type RPAREN ARROW LENGTH ID"""
+    p[0] = BoolVal(True)  # Parsed before in variables finding, as the `length` member of the array
+
+
 def p_mapping_assignment(p):
     """expression : ID LPAREN ARROW ID RPAREN ASSIGNMENT bin_op_rvalue LPAREN type RPAREN"""
     #               1               4                         7
@@ -542,18 +804,22 @@ def p_struct_ref(p):
 def init_msg(p):
     # Only for changing the msg index in each transaction
     msg_sender = symbol_table_manager.get_z3_variable('msg.sender', plus_plus=True, save=True)
+    address_sort = symbol_table_manager.address_sort
     p[0] = And(p[0], Or(
-        msg_sender == BitVecVal(0x1111111111111111111111111111111111111111, bv=256),
-        msg_sender == BitVecVal(0x2222222222222222222222222222222222222222, bv=256),
-        msg_sender == BitVecVal(0x3333333333333333333333333333333333333333, bv=256),
-        msg_sender == BitVecVal(0x4444444444444444444444444444444444444444, bv=256),
-        msg_sender == BitVecVal(0x5555555555555555555555555555555555555555, bv=256),
+        msg_sender == address_sort.cast(0x1111111111111111111111111111111111111111),
+        msg_sender == address_sort.cast(0x2222222222222222222222222222222222222222),
+        msg_sender == address_sort.cast(0x3333333333333333333333333333333333333333),
+        msg_sender == address_sort.cast(0x4444444444444444444444444444444444444444),
+        msg_sender == address_sort.cast(0x5555555555555555555555555555555555555555),
     ))
     p[0] = And(p[0], symbol_table_manager.get_z3_variable('msg.value', plus_plus=True, save=True) >= 0)
 
 
 def init_balances(p):
-    __temp_balance_addr = BitVec('__temp_balance_addr', bv=256)
+    if symbol_table_manager.mapping_encoding == 'array':
+        return  # The balances are a constant array
+
+    __temp_balance_addr = Const('__temp_balance_addr', symbol_table_manager.address_sort)
 
     p[0] = And(
         p[0],
@@ -561,7 +827,7 @@ def init_balances(p):
             [__temp_balance_addr],
             Implies(
                 BoolVal(True),
-                symbol_table_manager.balances_storage(__temp_balance_addr) == BitVecVal(0, bv=256),
+                symbol_table_manager.balances_storage(__temp_balance_addr) == 0,
             )
         ),
     )
@@ -569,9 +835,7 @@ def init_balances(p):
 
 def p_initialize_globals(p):
     """expression : INITIALIZE_GLOBS"""
-    p[0] = BoolVal(True)
-    for reference_name in symbol_table_manager.get_mapping_references:
-        p[0] = And(p[0], symbol_table_manager.get_z3_variable(reference_name, plus_plus=True, save=False) == 0)
+    p[0] = symbol_table_manager.initial_mappings()
 
     init_msg(p)
     init_balances(p)
@@ -587,9 +851,13 @@ def p_transaction_starts(p):
 def p_initialize_func_params(p):
     """expression : INITIALIZE_FUNC_PARAMS ID"""
     #      0                1              2
-    p[0] = BoolVal(True)
-
-    symbol_table_manager.get_z3_variable(p[2], plus_plus=True, save=True)
+    if symbol_table_manager.is_dynamic_array(p[2]):  # A new version of the elements and of the length
+        symbol_table_manager.get_ssa_index(p[2], plus_plus=True, save=True)
+        symbol_table_manager.get_ssa_index(f"{p[2]}.length", plus_plus=True, save=True)
+        p[0] = BoolVal(True)
+    else:
+        param = symbol_table_manager.get_z3_variable(p[2], plus_plus=True, save=True)
+        p[0] = symbol_table_manager.with_range_guard(p[2], param, BoolVal(True))
 
 
 def p_type_list(p):
@@ -632,29 +900,152 @@ def p_solidity_call(p):
         "revert": lambda params, declaration, lvalue: BoolVal(True),
         "balance": lambda params, declaration, lvalue: symbol_table_manager.get_z3_variable(
             lvalue, plus_plus=True, save=True,
-        ) == symbol_table_manager.balances_storage(
+        ) == symbol_table_manager.balance_of(
             _rvalue_processor(params[0])
         ),
     }.get(p[7])(params=p[12], declaration=p[9], lvalue=p[1])
 
 
+def _fit_width(value, variable):
+    """The bit-vector value truncated or zero-extended to the width of the variable, e.g., a uint256 to an address"""
+    if not is_bv(value) or not is_bv(variable) or value.size() == variable.size():
+        return value
+    if value.size() > variable.size():
+        return Extract(variable.size() - 1, 0, value)
+    return ZeroExt(variable.size() - value.size(), value)
+
+
 def p_convert(p):
     """expression : ID EQUAL CONVERT bin_op_rvalue TO type"""
     #      0        1    2      3      4     5   6
     if p[6] == 'ADDRESS':
         p[0] = symbol_table_manager.get_z3_variable(p[1], plus_plus=True, save=True)
         if p[4] == ('builtin', 'this'):
-            p[0] = p[0] == BitVecVal(0xffffffffffffffffffffffffffffffffffffffff, bv=256)
+            p[0] = p[0] == symbol_table_manager.address_sort.cast(0xffffffffffffffffffffffffffffffffffffffff)
         elif p[4][0] != 'const':
             _p4 = symbol_table_manager.get_z3_variable(p[4][1], plus_plus=True)
-            p[0] = p[0] == _p4
+            p[0] = p[0] == _fit_width(_p4, p[0])
         else:
             p[0] = p[0] == p[4][1]
     else:
         raise  # TODO: Others
 
 
-IR_PARSER = yacc.yacc(start="expression")  # TODO Add more yacc patterns
+# The parsing tables are generated once and stored in this module, next to this file. PLY checks the signature of
+# the grammar when loading them, so they are regenerated whenever the grammar changes.
+PARSER_TABLES_MODULE = 'slither_ir_parsetab'
+
+
+@lru_cache(maxsize=None)
+def ir_parser() -> yacc.LRParser:
+    """The parser is built (or its tables are loaded) on its first use instead of on import"""
+    return yacc.yacc(
+        module=sys.modules[__name__],
+        start="expression",
+        tabmodule=PARSER_TABLES_MODULE,
+        outputdir=os.path.dirname(os.path.abspath(__file__)),
+        debug=False,  # Do not write parser.out
+    )  # TODO Add more yacc patterns
+
+
+class IRTemplate:
+    """
+    The translation of an IR expression with `SSASlot` placeholders in place of the SSA indices. Instantiating it
+    replays the recorded symbol table accesses and substitutes the placeholders with the resulting indices.
+    """
+
+    def __init__(self, constraints, accesses: list):
+        self.constraints = constraints
+        self.accesses = accesses
+        self.placeholders = self.__find_placeholders(constraints) if isinstance(constraints, ExprRef) else []
+
+    @staticmethod
+    def __find_placeholders(expr: ExprRef) -> list:
+        placeholders, visited, stack = {}, set(), [expr]
+        while stack:
+            item = stack.pop()
+            if item.get_id() in visited:
+                continue
+            visited.add(item.get_id())
+
+            if is_quantifier(item):
+                stack.append(item.body())
+            elif is_const(item) and item.decl().kind() == Z3_OP_UNINTERPRETED:
+                if matched := SSASlot.NAME_PATTERN.match(item.decl().name()):
+                    placeholders[item.decl().name()] = (
+                        item,
+                        matched.group('prefix'),
+                        int(matched.group('access')),
+                        int(matched.group('offset') or 0),
+                    )
+            else:
+                stack.extend(item.children())
+        return list(placeholders.values())
+
+    def instantiate(self, symbol_table: SymbolTableManager):
+        indices = [
+            symbol_table.get_ssa_index(symbol_name, plus_plus=plus_plus, save=save)
+            for symbol_name, plus_plus, save in self.accesses
+        ]
+        if not self.placeholders:
+            return self.constraints
+
+        return substitute(self.constraints, *[
+            (
+                placeholder,
+                IntVal(indices[access] + offset) if prefix == '' else  # The SSA argument of references
+                Const(f"{prefix}{indices[access] + offset}", placeholder.sort())
+            )
+            for placeholder, prefix, access, offset in self.placeholders
+        ])
+
+
+class IRTranslationCache:
+    """LRU cache of the translated IR expressions as `IRTemplate`s, keyed by the arithmetic abstraction and the IR"""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.__templates = OrderedDict()
+        self.__types_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__templates)
+
+    def clear(self):
+        self.__templates.clear()
+
+    def translate(self, ir_expr: str):
+        if self.__types_version != symbol_table_manager.types_version:  # Templates depend on the variable types
+            self.clear()
+            self.__types_version = symbol_table_manager.types_version
+
+        key = (symbol_table_manager.arithmetic_abstraction, ir_expr)
+        if (template := self.__templates.get(key)) is not None:
+            self.hits += 1
+            self.__templates.move_to_end(key)
+        else:
+            self.misses += 1
+            with symbol_table_manager.recording() as accesses, metrics.timer('ply_parse'):
+                template = IRTemplate(ir_parser().parse(ir_expr, lexer=ir_lexer()), accesses)
+
+            if self.maxsize > 0:
+                self.__templates[key] = template
+                if len(self.__templates) > self.maxsize:
+                    self.__templates.popitem(last=False)
+                    self.evictions += 1
+
+        return template.instantiate(symbol_table_manager)
+
+    @property
+    def stats(self) -> str:
+        return f"hits={self.hits}, misses={self.misses}, evictions={self.evictions}, size={len(self)}/{self.maxsize}"
+
+
+ir_translation_cache = IRTranslationCache()
 
 
 class SlitherIR:
@@ -667,10 +1058,11 @@ class SlitherIR:
 
     @cached_property
     def tokens(self) -> List[lex.LexToken]:
-        IR_LEXER.input(self.expr)
+        lexer = ir_lexer()
+        lexer.input(self.expr)
 
         res = []
-        while (token := IR_LEXER.token()) is not None:
+        while (token := lexer.token()) is not None:
             res.append(token)
         return res
 
@@ -678,7 +1070,8 @@ class SlitherIR:
     def constraints(self):
         if self.expr.startswith("Emit"):  # TODO Add more to-ignore expressions
             return []
-        return IR_PARSER.parse(self.expr, lexer=IR_LEXER)
+        with metrics.timer('ir_translation'):
+            return ir_translation_cache.translate(self.expr)
 
 
 if __name__ == '__main__':  # For testing the PLY
@@ -691,4 +1084,4 @@ if __name__ == '__main__':  # For testing the PLY
         'result(uint256) := input(uint256)',
         'sellerBalance(uint256) := 0(uint256)',
     ]:
-        print(f"{example}: ", IR_PARSER.parse(example, lexer=IR_LEXER))
+        print(f"{example}: ", ir_parser().parse(example, lexer=ir_lexer()))
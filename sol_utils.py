@@ -2,38 +2,49 @@ import json
 import os
 import re
 from functools import cached_property
-from typing import Union, List
+from typing import Union, List, Dict, TYPE_CHECKING
 
 import networkx as nx
-import solcx
-from evm_cfg_builder import CFG as EVMCFG
-from pyevmasm import disassemble_hex
-from slither.core.cfg.node import NodeType as SlitherNodeType
-from slither.slither import Slither
-from solc_select import solc_select
 
 import utils
 from arg_parser import args
-from cfg_traversal_utils import WalkTree
+from cfg_serializer import serialize_cfg, deserialize_cfg
+from cfg_traversal_utils import WalkTree, CFGPath
+from compilation_cache import CompilationCache, source_hash
+from metrics import metrics
 from slither_utils import escape_expression
 from utils import disabled_stdout, class_property
 
 PRAGMA_SOLIDITY_VERSION_REGEX = re.compile(r'^pragma\ssolidity\s\^([\d.]+);$')
+IMPORT_REGEX = re.compile(r'^\s*import\s+(?:[^"\';]*\s)?["\'](?P<path>[^"\']+)["\']', re.MULTILINE)
 
 END_LINE = '\n'
 
+# The heavy tools are imported where they are used, so each run only pays for the imports on its own path. E.g.,
+# Slither is only imported when the CFG is built, not when a serialized CFG is loaded.
+if TYPE_CHECKING:
+    from evm_cfg_builder import CFG as EVMCFG
+    from slither.slither import Slither
+
 
 class SolcSelectHelper:
+    # Select the compiler version only for this process (and its children) instead of switching the global version of
+    # solc-select, so parallel runs with different pragmas do not race on it.
+    process_local = False
+
     @class_property
     def versions(self) -> list:
+        from solc_select import solc_select
         return solc_select.installed_versions()
 
     @class_property
     def current_version(self) -> str:
+        from solc_select import solc_select
         return solc_select.current_version()[0]
 
     @class_property
     def available_versions(self) -> list:
+        from solc_select import solc_select
         # noinspection PyBroadException
         try:
             return list(solc_select.get_available_versions().keys())
@@ -42,13 +53,14 @@ class SolcSelectHelper:
 
     @staticmethod
     def install(version: str) -> bool:
+        from solc_select import solc_select
         if version in SolcSelectHelper.versions:
             return True
         with disabled_stdout():
             try:
                 solc_select.install_artifacts([version, ])
                 return True
-            except:
+            except Exception:
                 return False
 
     @staticmethod
@@ -62,11 +74,16 @@ class SolcSelectHelper:
                 if SolcSelectHelper.install(version) is False:
                     return False
 
+        if SolcSelectHelper.process_local:
+            os.environ['SOLC_VERSION'] = version  # Takes precedence over the global version of solc-select
+            return True
+
+        from solc_select import solc_select
         with disabled_stdout():
             try:
                 solc_select.switch_global_version(version)
                 return True
-            except:
+            except Exception:
                 return False
 
 
@@ -77,6 +94,7 @@ class SolcHelper:
 
     @staticmethod
     def compile_source(source: str) -> dict:
+        import solcx
         return solcx.compile_source(
             source,
             output_values=SolcHelper.output_values
@@ -84,6 +102,7 @@ class SolcHelper:
 
     @staticmethod
     def compile_file(files: Union[str, list]) -> Union[dict, List]:
+        import solcx
         result = solcx.compile_files(
             files,
             output_values=SolcHelper.output_values
@@ -98,7 +117,11 @@ class SolFile:
     def __init__(self, path):
         self.path = path
         self.cfg_strategy = args.cfg_strategy
-        self.target = None
+        self.targets: List[str] = []  # The target nodes, in the order of their lines
+        self.__target_node_of_line: Dict[int, str] = {}
+
+        self.cache = CompilationCache(args.cache_dir, enabled=args.use_cache)
+        self.__cfg_header = None  # The target and the variables, which are stored along with the serialized CFG
 
     @cached_property
     def compiler_version(self) -> str:
@@ -123,11 +146,69 @@ class SolFile:
         utils.log(f"LoC: {val}")
         return val
 
+    @cached_property
+    def imports(self) -> Dict[str, str | None]:
+        """
+        The import closure of the source: the hash of each (transitively) imported file by its path, or `None` for the
+        imports which are not found (e.g., remapped ones). The relative imports are resolved against the importing
+        file, and the others against the directory of the contract and the working directory.
+        """
+        base_dirs = [os.path.dirname(os.path.abspath(args.contract)), os.getcwd()]
+        closure = {}
+        stack = [(os.path.dirname(os.path.abspath(args.contract)), self.source)]
+        while stack:
+            directory, source = stack.pop()
+            for matched in IMPORT_REGEX.finditer(source):
+                imported = matched.group('path')
+                candidates = [directory] if imported.startswith('.') else [directory, *base_dirs]
+                path = next((
+                    os.path.normpath(os.path.join(base_dir, imported)) for base_dir in candidates
+                    if os.path.isfile(os.path.join(base_dir, imported))
+                ), imported)
+                if path in closure:
+                    continue
+                if not os.path.isfile(path):
+                    closure[path] = None
+                    continue
+                with open(path) as f:
+                    imported_source = f.read()
+                closure[path] = source_hash(imported_source)
+                stack.append((os.path.dirname(path), imported_source))
+        return closure
+
+    @cached_property
+    def __compilation_key(self) -> tuple:
+        # Without the pragma, the compiler version is the globally selected one
+        return (
+            source_hash(self.source),
+            sorted(self.imports.items()),  # An edited import changes the artifacts and the CFG too
+            self.compiler_version or SolcSelectHelper.current_version,
+        )
+
+    @cached_property
+    def __cfg_key(self) -> tuple:
+        return *self.__compilation_key, self.cfg_strategy, args.cfg_expr_type, args.target
+
     @cached_property
     def compiled(self) -> dict:
+        if (compiled := self.cache.load('compiled.json', *self.__compilation_key)) is not None:
+            return compiled
+
+        with metrics.timer('compile'):
+            compiled = self.__compile()
+        self.cache.store('compiled.json', compiled, *self.__compilation_key)
+        return compiled
+
+    @cached_property
+    def selected_compiler(self) -> str | None:
+        """Select the compiler version of the pragma, which both Slither and the compilation use"""
         if self.compiler_version:  # TODO otherwise?
-            SolcSelectHelper.select(self.compiler_version, install=True)
+            with metrics.timer('solc_select'):
+                SolcSelectHelper.select(self.compiler_version, install=True)
+        return self.compiler_version
 
+    def __compile(self) -> dict:
+        _ = self.selected_compiler
         compiled = SolcHelper.compile_file(self.path)  # TODO what if there is more than one contract
         if isinstance(compiled, list):
             for contract in compiled:
@@ -144,7 +225,8 @@ class SolFile:
         return self.__get_compiled_param('bin-runtime')
 
     @cached_property
-    def bin_cfg(self) -> EVMCFG:
+    def bin_cfg(self) -> 'EVMCFG':
+        from evm_cfg_builder import CFG as EVMCFG
         return EVMCFG(self.bin)
 
     @cached_property
@@ -161,6 +243,7 @@ class SolFile:
 
     @cached_property
     def opcodes_pyevmasm(self) -> list:
+        from pyevmasm import disassemble_hex
         return disassemble_hex(self.bin).split('\n')
 
     @cached_property
@@ -180,11 +263,18 @@ class SolFile:
         return self.__get_compiled_param('asm')
 
     @cached_property
-    def slither(self) -> Slither:
-        return Slither(self.path)
+    def slither(self) -> 'Slither':
+        from slither.slither import Slither
+        _ = self.selected_compiler  # Slither compiles the contract too, even if the compilation is cached
+        with metrics.timer('slither'):
+            return Slither(self.path)
 
     @cached_property
     def variables(self):
+        _ = self.cfg  # The variables are stored along with the CFG
+        return dict(self.__cfg_header['variables'])  # A copy, as the walk tree adds the IR variables to it
+
+    def __variables(self):
         # TODO support more contracts
 
         # First, add global variables
@@ -196,16 +286,25 @@ class SolFile:
 
         return result
 
+    @property
+    def target(self) -> str | None:
+        """The first target node"""
+        return self.targets[0] if self.targets else None
+
     @cached_property
-    def insource_target_annotation(self):
+    def insource_target_annotations(self) -> List[tuple]:
         """
-        Find the target with @target annotation in the source code
-        :return: (lineno, target line) Tuple.
+        Find the targets with @target annotation in the source code
+        :return: List of (lineno, target line) Tuples.
         """
-        for indx, line in enumerate(self.source.split('\n')):
-            if "@target" in line:
-                return indx + 1, line
-        return -1, None
+        return [(indx + 1, line) for indx, line in enumerate(self.source.split('\n')) if "@target" in line]
+
+    @cached_property
+    def target_lines(self) -> List[int]:
+        """The line-numbers of the targets, by --target or the @target annotations if no --target is specified"""
+        if args.target is not None:
+            return sorted(set(args.target))
+        return [lineno for lineno, _ in self.insource_target_annotations]
 
     @cached_property
     def insource_heuristic_annotation(self):
@@ -238,18 +337,12 @@ class SolFile:
             if node_name_prefix == '':  # TODO: Maybe better implementation on not initializing library_calls
                 expr["irs"] = [f"INITIALIZE_FUNC_PARAMS {param_name}" for param_name in expr["params"]]
 
-        # Checks if this node is the target of Targeted Backward Symbolic Execution
-        if args.target is not None:
-            is_target = \
-                node.expression is not None \
-                and args.target in node.source_mapping['lines']
-        else:  # Read @target annotation if no --target is specified
-            lineno, _ = self.insource_target_annotation
-            is_target = \
-                lineno != -1 \
-                and node.expression is not None \
-                and lineno in node.source_mapping['lines']
-        is_target = is_target or False  # Set False if this is None
+        # Checks if this node is a target of Targeted Backward Symbolic Execution
+        target_lines = [
+            lineno for lineno in self.target_lines
+            if node.expression is not None and lineno in node.source_mapping['lines']
+        ]
+        is_target = len(target_lines) > 0
 
         cfg_x.add_node(
             f"{node_name_prefix}{func.name}_{node.node_id}",
@@ -262,8 +355,9 @@ class SolFile:
         )
 
         if is_target is True:
-            self.target = f"{func.name}_{node.node_id}"  # TODO: is it possible to have multiple targets?
-            utils.log(f"target node is {self.target}")
+            for lineno in target_lines:  # The last node on the line is the target of that line
+                self.__target_node_of_line[lineno] = f"{func.name}_{node.node_id}"
+            utils.log(f"target node is {func.name}_{node.node_id}")
 
         if self.cfg_strategy == 'compound':
             if func.name == 'slitherConstructorVariables' or func.name.startswith("constructor"):
@@ -284,6 +378,8 @@ class SolFile:
                 )
 
     def __cfg_add_func_edges(self, func, cfg_x, node_name_prefix=''):
+        from slither.core.cfg.node import NodeType as SlitherNodeType
+
         for node in func.nodes:
             if node.type in [SlitherNodeType.IF, SlitherNodeType.IFLOOP]:
                 if node.son_true:
@@ -422,6 +518,57 @@ class SolFile:
 
     @cached_property
     def cfg(self) -> nx.MultiDiGraph:
+        if args.cfg_file is not None:
+            with open(args.cfg_file) as f:
+                serialized = f.read()
+            utils.log(f"CFG is loaded from {args.cfg_file}")
+        else:
+            serialized = self.cache.load('cfg.jsonl', *self.__cfg_key)
+
+        metrics.set('cfg_cached', serialized is not None)
+        if serialized is not None:
+            with metrics.timer('cfg_load'):
+                cfg_x, self.__cfg_header = deserialize_cfg(serialized)
+            if args.cfg_file is not None:
+                self.__check_cfg_file_header(self.__cfg_header)
+            self.targets = self.__cfg_header['targets']
+            utils.log(f"Contract Name: {os.path.split(args.contract)[-1]} [{self.__cfg_header['contract_name']}]")
+            for target in self.targets:
+                utils.log(f"target node is {target}")
+        else:
+            _ = self.slither  # Slither is timed on its own
+            with metrics.timer('cfg_build'):
+                cfg_x = self.__build_cfg()
+            self.__cfg_header = {
+                'contract_name': self.slither.contracts[-1].name,
+                'source_hash': source_hash(self.source),
+                'target_lines': self.target_lines,
+                'targets': self.targets,
+                'variables': self.__variables(),
+            }
+            self.cache.store('cfg.jsonl', serialize_cfg(cfg_x, **self.__cfg_header), *self.__cfg_key)
+
+        utils.log(f"#NUM_OF_CFG_NODES: {cfg_x.nodes.__len__()}", level='info')
+        metrics.set('contract_name', self.__cfg_header['contract_name'])
+        metrics.set('targets', self.targets)
+        metrics.set('cfg_nodes', cfg_x.number_of_nodes())
+        metrics.set('cfg_edges', cfg_x.number_of_edges())
+        return cfg_x
+
+    def __check_cfg_file_header(self, header: dict) -> None:
+        """The CFG file must be exported from the same source, with the same target lines"""
+        if header.get('source_hash') != source_hash(self.source):
+            raise ValueError(f"{args.cfg_file} is not exported from {args.contract}, or the source is changed since")
+        if header.get('target_lines') != self.target_lines:
+            raise ValueError(f"{args.cfg_file} is exported with the target lines {header.get('target_lines')}, not "
+                             f"{self.target_lines}")
+
+    @cached_property
+    def compact_cfg(self) -> str:
+        """The CFG in the compact serialized format, which can be loaded by `--cfg-file` without running Slither"""
+        return serialize_cfg(self.cfg, **self.__cfg_header)
+
+    def __build_cfg(self) -> nx.MultiDiGraph:
         cfg_x = nx.MultiDiGraph()
 
         if self.cfg_strategy == 'compound':
@@ -458,7 +605,9 @@ class SolFile:
         self.__cfg_process_internal_calls(cfg_x)
         self.__cfg_process_library_calls(cfg_x)
 
-        utils.log(f"#NUM_OF_CFG_NODES: {cfg_x.nodes.__len__()}", level='debug')
+        self.targets = list(dict.fromkeys(
+            self.__target_node_of_line[lineno] for lineno in sorted(self.__target_node_of_line)
+        ))
         return cfg_x
 
     @cached_property
@@ -466,6 +615,8 @@ class SolFile:
         return self.cfg.reverse(copy=True)
 
     @cached_property
-    def find_test_data(self):
-        utils.log(f"finding optimal SAT path from '{self.target}' to 'start'", level='debug')
-        return WalkTree(contract=self, reversed_cfg=self.reversed_cfg, target_node=self.target).traverse()
+    def find_test_data(self) -> Dict[str, CFGPath | None]:
+        """The SAT path from each target node to the entry point, all found in one traversal"""
+        _ = self.cfg  # Finds the targets
+        utils.log(f"finding optimal SAT path from {self.targets} to 'start'", level='debug')
+        return WalkTree(contract=self, reversed_cfg=self.reversed_cfg, target_nodes=self.targets).traverse()
@@ -1,7 +1,14 @@
+import atexit
+import json
 import os
 import sys
+import threading
+import time
+from typing import Callable, Union
 
-from workspace import workspace
+from workspace import current_workspace
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
 
 
 class disabled_stdout:
@@ -21,11 +28,80 @@ class class_property(property):
         return classmethod(self.fget).__get__(None, owner)()
 
 
-def log(msg: str, level='info') -> None:
-    from arg_parser import args
+class Logger:
+    """
+    Writes the log of the current workspace to `out.log` (and `out.jsonl` with --log-jsonl) through long-lived, buffered
+    file handles, which are reopened when the workspace changes. Messages below --log-level are dropped before being
+    formatted.
+    """
+
+    def __init__(self):
+        self.__lock = threading.RLock()  # The exports log from a background thread
+        self.__workspace = None
+        self.__text_file = None
+        self.__jsonl_file = None
+
+    @staticmethod
+    def level() -> str:
+        from arg_parser import args
+
+        if getattr(args, 'log_level', None) is not None:
+            return args.log_level
+        return 'debug' if getattr(args, 'debug', False) else 'info'
+
+    def is_enabled(self, level: str) -> bool:
+        return LOG_LEVELS[level] >= LOG_LEVELS[self.level()]
+
+    def __open(self, workspace) -> None:
+        from arg_parser import args
+
+        self.close()
+        self.__workspace = workspace
+        self.__text_file = open(f"{workspace}/out.log", "a")
+        if getattr(args, 'log_jsonl', False):
+            self.__jsonl_file = open(f"{workspace}/out.jsonl", "a")
+
+    def log(self, msg: Union[str, Callable[[], str]], level: str = 'info') -> None:
+        from arg_parser import args
+
+        if not self.is_enabled(level):
+            return
+
+        msg = msg() if callable(msg) else msg
+        if getattr(args, 'debug', False):
+            print(f'[{level}] {msg}', file=sys.stderr)
+
+        if (workspace := current_workspace()) is None:  # e.g., the batch process itself
+            return
+
+        with self.__lock:
+            if workspace != self.__workspace:
+                self.__open(workspace)
+
+            print(f'[{level}] {msg}', file=self.__text_file)
+            if self.__jsonl_file is not None:
+                print(json.dumps({'time': time.time(), 'level': level, 'msg': str(msg)}), file=self.__jsonl_file)
+            if level == 'error':
+                self.flush()
+
+    def flush(self) -> None:
+        with self.__lock:
+            for f in (self.__text_file, self.__jsonl_file):
+                if f is not None:
+                    f.flush()
+
+    def close(self) -> None:
+        with self.__lock:
+            for f in (self.__text_file, self.__jsonl_file):
+                if f is not None:
+                    f.close()
+            self.__workspace = self.__text_file = self.__jsonl_file = None
+
+
+logger = Logger()
+atexit.register(logger.close)
 
-    if args.debug:
-        print(f'[{level}] {msg}', file=sys.stderr)
 
-    with open(f"{workspace}/out.log", "a") as f:
-        print(f'[{level}] {msg}', file=f)
+def log(msg: Union[str, Callable[[], str]], level='info') -> None:
+    """Log `msg`, which can be a callable to only build the message when `level` is enabled"""
+    logger.log(msg, level)
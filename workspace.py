@@ -3,11 +3,14 @@ import re
 import shutil
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 from arg_parser import args
 
 OUTPUT_DIR = pathlib.Path('output/')
 
+__workspace: Optional[Path] = None
+
 
 def copy_contract_to_workspace(_workspace):
     if args.target is not None:  # We have --target command
@@ -24,17 +27,26 @@ def copy_contract_to_workspace(_workspace):
 
 
 def prepare_workspace() -> Path:
+    global __workspace
+
     if args.clean_workspace:
         shutil.rmtree(OUTPUT_DIR.__str__())
         OUTPUT_DIR.mkdir()
 
-    tempdir = OUTPUT_DIR.joinpath(datetime.now().strftime("%Y-%m-%d-%H:%M:%S.%f"))
+    while True:  # Parallel runs (e.g., batch mode) may pick the same timestamp
+        tempdir = OUTPUT_DIR.joinpath(datetime.now().strftime("%Y-%m-%d-%H:%M:%S.%f"))
+        try:
+            pathlib.Path(tempdir).mkdir()
+            break
+        except FileExistsError:
+            continue
     __workspace = pathlib.Path(tempdir)
-    __workspace.mkdir()
 
     copy_contract_to_workspace(__workspace)
 
     return __workspace
 
 
-workspace = prepare_workspace()
+def current_workspace() -> Optional[Path]:
+    """The workspace of the current run, `None` before prepare_workspace() is called"""
+    return __workspace